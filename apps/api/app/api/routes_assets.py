@@ -9,9 +9,11 @@ from glocal_shared_schemas import UploadAssetComplete, UploadAssetUrlRequest, Up
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.db.session import get_db
 from app.deps.auth import get_current_user
 from app.models.entities import AppUser, Asset, Project
+from app.services.rabbitmq import publish_event
 from app.services.storage import storage_service
 
 router = APIRouter()
@@ -82,4 +84,16 @@ async def complete_upload(
     )
     db.add(asset)
     await db.commit()
+    if settings.job_dispatch == "rabbitmq":
+        # ingest-agent probes the upload once and stores the result in asset.meta["probe"].
+        # With database dispatch, single-node's poller picks up uningested assets instead.
+        await publish_event(
+            "asset.uploaded",
+            {
+                "asset_id": asset.id,
+                "project_id": asset.project_id,
+                "key": object_path,
+                "type": asset.type,
+            },
+        )
     return {"id": asset.id}
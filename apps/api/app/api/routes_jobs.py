@@ -14,6 +14,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sse_starlette.sse import EventSourceResponse
 
+from app.core.config import settings
 from app.db.session import get_db
 from app.deps.auth import get_current_user, get_user_from_request
 from app.models.entities import (
@@ -129,21 +130,22 @@ async def create_job(
     )
     job = result.scalar_one()
 
-    await publish_event(
-        "job.created",
-        {
-            "job_id": job.id,
-            "project_id": project.id,
-            "languages": payload.languages,
-            "voice_profile_id": payload.voiceProfileId,
-            "options": job.options,
-            "source_asset": {
-                "id": asset.id,
-                "s3_url": asset.s3_url,
-                "type": asset.type,
+    if settings.job_dispatch == "rabbitmq":
+        await publish_event(
+            "job.created",
+            {
+                "job_id": job.id,
+                "project_id": project.id,
+                "languages": payload.languages,
+                "voice_profile_id": payload.voiceProfileId,
+                "options": job.options,
+                "source_asset": {
+                    "id": asset.id,
+                    "s3_url": asset.s3_url,
+                    "type": asset.type,
+                },
             },
-        },
-    )
+        )
     return await _job_to_schema(job)
 
 
@@ -21,6 +21,8 @@ class Settings(BaseSettings):
     api_base_url: str = "http://api:8080"
     public_api_url: str = "http://localhost:8080"
     cors_origins: List[str] = ["http://localhost:3000"]
+    # "rabbitmq" publishes job.created; "database" leaves queued jobs for the single-node runner.
+    job_dispatch: str = "rabbitmq"
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -8,5 +8,6 @@ from app.models.entities import (  # noqa: F401
     LocalizationJob,
     LocalizedVariant,
     Project,
+    TranslationMemory,
     VoiceProfile,
 )
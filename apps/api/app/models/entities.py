@@ -96,6 +96,27 @@ class BrandGlossary(Base):
     project: Mapped[Project] = relationship(backref="glossaries")
 
 
+class TranslationMemory(Base):
+    __tablename__ = "translation_memory"
+
+    source_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    target_lang: Mapped[str] = mapped_column(Text, primary_key=True)
+    glossary_version: Mapped[str] = mapped_column(String(64), primary_key=True)
+    backend: Mapped[str] = mapped_column(Text, primary_key=True)
+    source_text: Mapped[str] = mapped_column(Text, nullable=False)
+    translated_text: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+    )
+    last_used_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+    )
+
+
 class LocalizationJob(Base):
     __tablename__ = "localization_job"
 
@@ -32,7 +32,10 @@ async def get_exchange() -> aio_pika.abc.AbstractExchange:
 
 async def publish_event(routing_key: str, payload: Dict[str, Any]) -> None:
     exchange = await get_exchange()
-    message = aio_pika.Message(body=json.dumps(payload).encode("utf-8"))
+    message = aio_pika.Message(
+        body=json.dumps(payload).encode("utf-8"),
+        content_type="application/json",
+    )
     await exchange.publish(message, routing_key=routing_key)
 
 
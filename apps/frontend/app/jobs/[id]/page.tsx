@@ -13,7 +13,7 @@ import { useToast } from "@/components/ui/use-toast";
 import { useAuth } from "@/hooks/use-auth";
 import { getJob, jobEventSource, type LocalizationJob } from "@/lib/api";
 
-const PIPELINE = ["asr", "translate", "tts", "mix", "subs", "textinframe", "qc", "pack"] as const;
+const PIPELINE = ["asr", "video", "translate", "tts", "mix", "subs", "textinframe", "qc", "pack"] as const;
 
 type StageName = (typeof PIPELINE)[number];
 
@@ -35,6 +35,7 @@ export type JobOptions = {
   subs: boolean;
   dub: boolean;
   replace_text_in_frame: boolean;
+  fuse_text_in_frame?: boolean;
   upload_to_youtube: boolean;
 };
 
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS translation_memory (
+    source_hash VARCHAR(64) NOT NULL,
+    target_lang TEXT NOT NULL,
+    glossary_version VARCHAR(64) NOT NULL,
+    backend TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    translated_text TEXT NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (source_hash, target_lang, glossary_version, backend)
+);
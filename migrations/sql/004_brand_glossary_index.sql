@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_brand_glossary_project ON brand_glossary (project_id);
@@ -1,21 +1,73 @@
+from .cache import ArtifactCache
 from .config import ServiceSettings, get_settings
 from .db import Database, database
+from .executor import CpuExecutor, cpu_executor
+from .local import LocalBroker, LocalStorage, local_events, publish_local_job_event
+from .media import (
+    HLS_CONTENT_TYPES,
+    HLS_MANIFEST,
+    HLS_SEGMENT_SECONDS,
+    FfmpegRun,
+    ffmpeg_input,
+    ffprobe,
+    keyframe_args,
+    keyframe_intervals,
+    localized_text,
+    media_duration,
+    mp4_and_hls_output,
+    probe_source,
+    run_ffmpeg,
+    text_overlay_filter,
+    trim_args,
+    write_mp4_and_hls,
+)
 from .messaging import RabbitMQ, rabbitmq
-from .paths import job_stage_key, job_stage_local
+from .paths import analysis_key, content_key, job_key, job_stage_key, job_stage_local
 from .progress import publish_job_event
 from .s3_utils import parse_s3_url
-from .storage import S3Storage, storage
+from .storage import S3Storage, UploadStats, storage
+
+if get_settings().runtime_mode == "local":
+    rabbitmq = LocalBroker()  # type: ignore[assignment]  # noqa: F811
+    storage = LocalStorage()  # type: ignore[assignment]  # noqa: F811
+    publish_job_event = publish_local_job_event  # noqa: F811
 
 __all__ = [
     "ServiceSettings",
     "get_settings",
     "Database",
     "database",
+    "CpuExecutor",
+    "cpu_executor",
     "RabbitMQ",
     "rabbitmq",
+    "LocalBroker",
+    "LocalStorage",
+    "local_events",
     "publish_job_event",
     "S3Storage",
+    "UploadStats",
     "storage",
+    "ArtifactCache",
+    "FfmpegRun",
+    "run_ffmpeg",
+    "HLS_CONTENT_TYPES",
+    "HLS_MANIFEST",
+    "HLS_SEGMENT_SECONDS",
+    "ffmpeg_input",
+    "ffprobe",
+    "keyframe_args",
+    "keyframe_intervals",
+    "mp4_and_hls_output",
+    "probe_source",
+    "localized_text",
+    "media_duration",
+    "text_overlay_filter",
+    "trim_args",
+    "write_mp4_and_hls",
+    "analysis_key",
+    "content_key",
+    "job_key",
     "job_stage_key",
     "job_stage_local",
     "parse_s3_url",
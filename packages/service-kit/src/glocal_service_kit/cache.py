@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from glocal_service_kit.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+STATS_LOG_EVERY = 50
+
+Download = Callable[[Path], Awaitable[None]]
+
+
+def staging_path(target: Path) -> Path:
+    return target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+
+
+async def place_file(source: Path, target: Path) -> None:
+    # Hard links make the hand-off free; fall back to a copy across filesystems.
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = staging_path(target)
+    try:
+        os.link(source, staging)
+    except OSError:
+        await asyncio.to_thread(shutil.copyfile, source, staging)
+    os.replace(staging, target)
+
+
+class ArtifactCache:
+    def __init__(self, root: Path, max_bytes: int, min_object_bytes: int = 0) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_object_bytes = min_object_bytes
+        self.objects = root / "objects"
+        self.locks = root / "locks"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.locks.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+
+    def accepts(self, size: int) -> bool:
+        return self.min_object_bytes <= size <= self.max_bytes
+
+    @staticmethod
+    def entry_name(bucket: str, key: str, etag: str) -> str:
+        # The ETag changes whenever the object is overwritten, so stale entries are never served.
+        return hashlib.sha256(f"{bucket}/{key}\0{etag}".encode("utf-8")).hexdigest()
+
+    def _lock_path(self, name: str) -> Path:
+        # Entries share a fixed set of 256 lock files (one per leading hex byte), so the lock
+        # directory stays bounded; unlinking a per-entry lock on eviction would race with
+        # waiters still blocked on the old inode.
+        return self.locks / f"{name[:2]}.lock"
+
+    @asynccontextmanager
+    async def _locked(self, name: str) -> AsyncIterator[None]:
+        # flock coordinates every worker process on the node that shares this directory.
+        fd = os.open(self._lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    async def fetch(
+        self,
+        bucket: str,
+        key: str,
+        etag: str,
+        size: int,
+        target: Path,
+        download: Download,
+    ) -> None:
+        name = self.entry_name(bucket, key, etag)
+        entry = self.objects / name
+        async with self._locked(name):
+            hit = entry.is_file()
+            if hit:
+                # mtime doubles as the LRU clock; atime is unreliable on noatime mounts.
+                os.utime(entry)
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                staging = staging_path(entry)
+                try:
+                    await download(staging)
+                    os.replace(staging, entry)
+                finally:
+                    staging.unlink(missing_ok=True)
+                self.misses += 1
+                self.bytes_downloaded += size
+            await place_file(entry, target)
+        if (self.hits + self.misses) % STATS_LOG_EVERY == 0:
+            logger.info("Artifact cache %s", self.stats())
+        if not hit:
+            await asyncio.to_thread(self.evict)
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for path in self.objects.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            fd = os.open(self._lock_path(path.name), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # Skip entries another worker is filling or reading right now.
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            finally:
+                os.close(fd)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "bytes_downloaded": self.bytes_downloaded,
+            "evictions": self.evictions,
+        }
+
+
+def artifact_cache_from_settings() -> ArtifactCache | None:
+    settings = get_settings()
+    if not settings.artifact_cache_dir:
+        return None
+    return ArtifactCache(
+        Path(settings.artifact_cache_dir),
+        max_bytes=settings.artifact_cache_max_mb * MB,
+        min_object_bytes=settings.artifact_cache_min_kb * 1024,
+    )
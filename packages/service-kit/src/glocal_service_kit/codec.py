@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Protocol
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional codec
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class Codec(Protocol):
+    name: str
+    content_type: str
+
+    def encode(self, payload: dict[str, Any]) -> bytes:
+        ...
+
+    def decode(self, body: bytes) -> dict[str, Any]:
+        ...
+
+
+class JsonCodec:
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, payload: dict[str, Any]) -> bytes:
+        return json.dumps(payload).encode("utf-8")
+
+    def decode(self, body: bytes) -> dict[str, Any]:
+        payload: dict[str, Any] = json.loads(body.decode("utf-8"))
+        return payload
+
+
+class OrjsonCodec:
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, payload: dict[str, Any]) -> bytes:
+        return orjson.dumps(payload)
+
+    def decode(self, body: bytes) -> dict[str, Any]:
+        payload: dict[str, Any] = orjson.loads(body)
+        return payload
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def encode(self, payload: dict[str, Any]) -> bytes:
+        packed: bytes = msgpack.packb(payload, use_bin_type=True)
+        return packed
+
+    def decode(self, body: bytes) -> dict[str, Any]:
+        unpacked: dict[str, Any] = msgpack.unpackb(body, raw=False)
+        return unpacked
+
+
+def available_codecs() -> dict[str, Codec]:
+    codecs: dict[str, Codec] = {"json": JsonCodec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    if msgpack is not None:
+        codecs["msgpack"] = MsgpackCodec()
+    return codecs
+
+
+CODECS = available_codecs()
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]
+    except KeyError as exc:
+        raise ValueError(f"Message codec {name!r} is not available") from exc
+
+
+def codec_for_content_type(content_type: str | None) -> Codec:
+    # Messages without a content type predate the codec layer and are always JSON.
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return get_codec("msgpack")
+    if content_type in (None, "", JSON_CONTENT_TYPE):
+        return CODECS.get("orjson") or CODECS["json"]
+    raise ValueError(f"Unsupported message content type {content_type!r}")
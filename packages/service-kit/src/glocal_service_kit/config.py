@@ -2,20 +2,62 @@ from __future__ import annotations
 
 from functools import lru_cache
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+DISTRIBUTED_ONLY_SETTINGS = (
+    "redis_url",
+    "rabbitmq_url",
+    "s3_endpoint",
+    "s3_access_key",
+    "s3_secret_key",
+)
+
 
 class ServiceSettings(BaseSettings):
     app_env: str = "dev"
     service_name: str = "worker"
+    # "distributed" talks to RabbitMQ, Redis and S3; "local" runs everything in one process.
+    runtime_mode: str = "distributed"
+    local_data_dir: str = "/tmp/glocal-local"
     postgres_dsn: str
-    redis_url: str
-    rabbitmq_url: str
-    s3_endpoint: str
+    redis_url: str = ""
+    rabbitmq_url: str = ""
+    s3_endpoint: str = ""
     s3_region: str = "eu-central-1"
-    s3_bucket: str
-    s3_access_key: str
-    s3_secret_key: str
+    s3_bucket: str = "glocal-media"
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    s3_max_pool_connections: int = 32
+    s3_multipart_threshold_mb: int = 8
+    s3_multipart_chunksize_mb: int = 8
+    s3_max_concurrency: int = 10
+    s3_upload_concurrency: int = 8
+    s3_upload_retries: int = 3
+    # "download" fetches media through the artifact cache; "presigned" hands ffmpeg/ffprobe a
+    # short-lived GET URL instead and bypasses the cache, for nodes without a cache volume.
+    media_input_mode: str = "download"
+    media_url_expires_seconds: int = 3600
+    # Node-local download cache shared by workers mounting the same directory; empty disables it.
+    artifact_cache_dir: str = ""
+    artifact_cache_max_mb: int = 10240
+    artifact_cache_min_kb: int = 1024
+    # Wall-clock limit per ffmpeg run (0 disables it) and minimum gap between progress events.
+    ffmpeg_timeout_seconds: float = 7200
+    ffmpeg_progress_interval_seconds: float = 2.0
+    # One tee pass writes MP4 and HLS together; false falls back to the MP4 encode followed
+    # by a stream-copy HLS remux.
+    hls_single_pass: bool = True
+    # Worker processes for CPU-bound stage work; 0 runs it on a thread in-process instead.
+    cpu_workers: int = 2
+    translation_backend: str = "stub"
+    translation_batch_size: int = 64
+    translation_concurrency: int = 4
+    rabbitmq_prefetch: int = 5
+    rabbitmq_publisher_confirms: bool = True
+    message_codec: str = "json"
+    # 0 keeps each service's own default passed to RabbitMQ.consume.
+    consumer_concurrency: int = 0
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -23,6 +65,18 @@ class ServiceSettings(BaseSettings):
         case_sensitive=False,
     )
 
+    @model_validator(mode="after")
+    def check_runtime_mode(self) -> "ServiceSettings":
+        if self.runtime_mode not in ("distributed", "local"):
+            raise ValueError(f"Unknown runtime_mode {self.runtime_mode!r}")
+        if self.media_input_mode not in ("presigned", "download"):
+            raise ValueError(f"Unknown media_input_mode {self.media_input_mode!r}")
+        if self.runtime_mode == "distributed":
+            missing = [name for name in DISTRIBUTED_ONLY_SETTINGS if not getattr(self, name)]
+            if missing:
+                raise ValueError(f"Missing settings for distributed mode: {', '.join(missing)}")
+        return self
+
 
 @lru_cache
 def get_settings() -> ServiceSettings:
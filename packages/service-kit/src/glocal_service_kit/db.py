@@ -25,7 +25,22 @@ class Database:
         await self.connect()
         assert self._pool
         row = await self._pool.fetchrow("SELECT * FROM asset WHERE id = $1", asset_id)
-        return dict(row) if row else None
+        if row is None:
+            return None
+        asset = dict(row)
+        # asyncpg hands JSONB back as text unless a codec is registered.
+        if isinstance(asset.get("meta"), str):
+            asset["meta"] = json.loads(asset["meta"])
+        return asset
+
+    async def update_asset_meta(self, asset_id: str, meta: dict) -> None:
+        await self.connect()
+        assert self._pool
+        await self._pool.execute(
+            "UPDATE asset SET meta = meta || $2::jsonb WHERE id = $1",
+            asset_id,
+            json.dumps(meta),
+        )
 
     async def fetch_voice_profile(self, profile_id: str) -> dict | None:
         await self.connect()
@@ -33,6 +48,74 @@ class Database:
         row = await self._pool.fetchrow("SELECT * FROM voice_profile WHERE id = $1", profile_id)
         return dict(row) if row else None
 
+    async def fetch_glossary(self, project_id: str) -> list[dict]:
+        await self.connect()
+        assert self._pool
+        rows = await self._pool.fetch(
+            "SELECT term, target_map FROM brand_glossary WHERE project_id = $1 ORDER BY term",
+            project_id,
+        )
+        return [
+            {
+                "term": row["term"],
+                "target_map": (
+                    json.loads(row["target_map"])
+                    if isinstance(row["target_map"], str)
+                    else row["target_map"]
+                ),
+            }
+            for row in rows
+        ]
+
+    async def fetch_translations(
+        self,
+        lang: str,
+        glossary_version: str,
+        backend: str,
+        source_hashes: list[str],
+    ) -> dict[str, str]:
+        await self.connect()
+        assert self._pool
+        rows = await self._pool.fetch(
+            """
+            UPDATE translation_memory
+            SET last_used_at = NOW()
+            WHERE target_lang = $1
+              AND glossary_version = $2
+              AND backend = $3
+              AND source_hash = ANY($4::text[])
+            RETURNING source_hash, translated_text
+            """,
+            lang,
+            glossary_version,
+            backend,
+            source_hashes,
+        )
+        return {row["source_hash"]: row["translated_text"] for row in rows}
+
+    async def store_translations(
+        self,
+        lang: str,
+        glossary_version: str,
+        backend: str,
+        entries: list[tuple[str, str, str]],
+    ) -> None:
+        # entries are (source_hash, source_text, translated_text)
+        await self.connect()
+        assert self._pool
+        await self._pool.executemany(
+            """
+            INSERT INTO translation_memory
+                (source_hash, target_lang, glossary_version, backend, source_text, translated_text)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (source_hash, target_lang, glossary_version, backend) DO NOTHING
+            """,
+            [
+                (source_hash, lang, glossary_version, backend, source_text, translated_text)
+                for source_hash, source_text, translated_text in entries
+            ],
+        )
+
     async def fetch_variant(self, variant_id: str) -> dict | None:
         await self.connect()
         assert self._pool
@@ -61,6 +144,26 @@ class Database:
             "variants": [dict(v) for v in variants],
         }
 
+    async def fetch_queued_job_ids(self) -> list[str]:
+        await self.connect()
+        assert self._pool
+        rows = await self._pool.fetch(
+            "SELECT id FROM localization_job WHERE status = 'queued' ORDER BY created_at"
+        )
+        return [row["id"] for row in rows]
+
+    async def fetch_uningested_assets(self) -> list[dict]:
+        await self.connect()
+        assert self._pool
+        rows = await self._pool.fetch(
+            """
+            SELECT id, project_id, type, s3_url FROM asset
+            WHERE NOT (meta ? 'probe') AND NOT (meta ? 'ingest_error')
+            ORDER BY created_at
+            """
+        )
+        return [dict(row) for row in rows]
+
     async def update_job_status(self, job_id: str, status: str, error: str | None = None) -> None:
         await self.connect()
         assert self._pool
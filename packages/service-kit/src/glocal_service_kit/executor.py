@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.abc
+import importlib.util
+import logging
+import multiprocessing
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any, Callable, Sequence, TypeVar
+
+from glocal_service_kit.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+STATS_LOG_EVERY = 100
+
+
+class _FileModuleFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, paths: dict[str, str]) -> None:
+        self.paths = paths
+
+    def find_spec(
+        self, fullname: str, path: Sequence[str] | None, target: ModuleType | None = None
+    ) -> ModuleSpec | None:
+        location = self.paths.get(fullname)
+        return importlib.util.spec_from_file_location(fullname, location) if location else None
+
+
+def _install_module_paths(paths: dict[str, str]) -> None:
+    # Runs in each worker: modules the parent loaded from file paths become importable by
+    # name, so tasks referencing them unpickle; each is only loaded when a task needs it.
+    sys.meta_path.append(_FileModuleFinder(paths))
+
+
+def _timed_call(fn: Callable[..., T], args: tuple[Any, ...]) -> tuple[float, float, T]:
+    # Runs in the worker process; wall-clock stamps are comparable across processes.
+    started = time.time()
+    result = fn(*args)
+    return started, time.time() - started, result
+
+
+class CpuExecutor:
+    def __init__(self, workers: int | None = None) -> None:
+        self.settings = get_settings()
+        self.workers = self.settings.cpu_workers if workers is None else workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._module_paths: dict[str, str] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self._durations: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        self._waits: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+
+    @property
+    def in_flight(self) -> int:
+        return self.submitted - self.completed - self.failed
+
+    @property
+    def queue_depth(self) -> int:
+        # Tasks beyond the pool size are waiting for a free worker process.
+        return max(self.in_flight - max(self.workers, 1), 0)
+
+    def register_module(self, name: str, path: str) -> None:
+        # For modules loaded via spec_from_file_location; call before the first run().
+        self._module_paths[name] = path
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Workers come from a fresh forkserver process, never from this one: forking a
+            # process that already runs aioboto3/aio_pika threads can inherit held locks.
+            context = multiprocessing.get_context("forkserver")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_install_module_paths,
+                initargs=(dict(self._module_paths),),
+            )
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        # fn and args are pickled, so fn must be a module-level function.
+        name = getattr(fn, "__qualname__", repr(fn))
+        submitted_at = time.time()
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            if self.workers > 0:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self.pool(), _timed_call, fn, args
+                )
+                started, duration, result = await future
+            else:
+                started, duration, result = await asyncio.to_thread(_timed_call, fn, args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM kill); start a fresh pool for the next task.
+            self.failed += 1
+            self._reset()
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        self.completed += 1
+        self._record(self._durations[name], duration)
+        self._record(self._waits[name], max(started - submitted_at, 0.0))
+        if self.completed % STATS_LOG_EVERY == 0:
+            logger.info("CPU executor %s", self.stats())
+        return result
+
+    @staticmethod
+    def _record(metric: list[float], seconds: float) -> None:
+        metric[0] += 1
+        metric[1] += seconds
+        metric[2] = max(metric[2], seconds)
+
+    def _reset(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict[str, Any]:
+        tasks = {}
+        for name, (count, total, longest) in sorted(self._durations.items()):
+            _, wait_total, wait_longest = self._waits[name]
+            tasks[name] = {
+                "count": int(count),
+                "mean_s": round(total / count, 4),
+                "max_s": round(longest, 4),
+                "mean_wait_s": round(wait_total / count, 4),
+                "max_wait_s": round(wait_longest, 4),
+            }
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "tasks": tasks,
+        }
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+cpu_executor = CpuExecutor()
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import os
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from glocal_service_kit.cache import place_file, staging_path
+from glocal_service_kit.config import get_settings
+from glocal_service_kit.messaging import HandlerPool, MessageHandler
+from glocal_service_kit.progress import build_job_event
+from glocal_service_kit.storage import UploadStats, upload_directory_with
+
+logger = logging.getLogger(__name__)
+
+# (queue name, routing key, seconds spent queued, seconds spent in the handler)
+MessageObserver = Callable[[str, str, float, float], None]
+QueuedMessage = tuple[str, float, dict[str, Any]]
+# How long join waits between checks for messages that no consumer will ever take.
+STALL_CHECK_SECONDS = 1.0
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    return _match_words(pattern.split("."), routing_key.split("."))
+
+
+def _match_words(pattern: list[str], words: list[str]) -> bool:
+    if not pattern:
+        return not words
+    head, rest = pattern[0], pattern[1:]
+    if head == "#":
+        return any(_match_words(rest, words[idx:]) for idx in range(len(words) + 1))
+    if not words:
+        return False
+    return head in ("*", words[0]) and _match_words(rest, words[1:])
+
+
+class LocalBroker:
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._queues: dict[str, asyncio.Queue[QueuedMessage]] = {}
+        self._bindings: list[tuple[str, str, str]] = []
+        self._consumers: Counter[str] = Counter()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self.observer: MessageObserver | None = None
+
+    def _queue(self, name: str) -> asyncio.Queue[QueuedMessage]:
+        queue = self._queues.get(name)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[name] = queue
+        return queue
+
+    async def declare_queue(self, name: str, routing_key: str, exchange: str = "jobs") -> None:
+        self._queue(name)
+        binding = (exchange, routing_key, name)
+        if binding not in self._bindings:
+            self._bindings.append(binding)
+
+    async def consume(
+        self,
+        queue_name: str,
+        handler: MessageHandler,
+        *,
+        concurrency: int = 1,
+        order_key: str | None = None,
+    ) -> None:
+        limit = self.settings.consumer_concurrency or concurrency
+        queue = self._queue(queue_name)
+        pool = HandlerPool(max(limit, 1), order_key, queue_name)
+
+        async def process(routing_key: str, queued_at: float, payload: dict[str, Any]) -> None:
+            started = time.perf_counter()
+            try:
+                await handler(payload)
+            finally:
+                if self.observer is not None:
+                    elapsed = time.perf_counter() - started
+                    self.observer(queue_name, routing_key, started - queued_at, elapsed)
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.set()
+
+        self._consumers[queue_name] += 1
+        try:
+            while True:
+                routing_key, queued_at, payload = await queue.get()
+                await pool.submit(payload, process(routing_key, queued_at, payload))
+        finally:
+            self._consumers[queue_name] -= 1
+            await pool.drain()
+
+    async def publish(
+        self,
+        routing_key: str,
+        payload: dict[str, Any],
+        exchange: str = "jobs",
+    ) -> None:
+        targets = {
+            queue_name
+            for bound_exchange, pattern, queue_name in self._bindings
+            if bound_exchange == exchange and topic_matches(pattern, routing_key)
+        }
+        if not targets:
+            logger.debug("Dropping unroutable message %s", routing_key)
+        for queue_name in targets:
+            # Consumers get their own copy, as they would after a broker round trip.
+            self._pending += 1
+            self._queues[queue_name].put_nowait(
+                (routing_key, time.perf_counter(), copy.deepcopy(payload))
+            )
+
+    async def publish_batch(
+        self,
+        messages: Iterable[tuple[str, dict[str, Any]]],
+        exchange: str = "jobs",
+    ) -> None:
+        for routing_key, payload in messages:
+            await self.publish(routing_key, payload, exchange)
+
+    async def join(self) -> None:
+        # Handlers publish follow-up messages, so only return once nothing is queued or running.
+        while self._pending:
+            self._idle.clear()
+            try:
+                await asyncio.wait_for(self._idle.wait(), STALL_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                self._check_stalled()
+
+    def _check_stalled(self) -> None:
+        # Nothing is running and every pending message sits in a queue nobody consumes (a
+        # service was not loaded or its consumer exited), so waiting longer would hang forever.
+        stalled = {
+            name: queue.qsize()
+            for name, queue in self._queues.items()
+            if queue.qsize() and not self._consumers[name]
+        }
+        if stalled and sum(stalled.values()) == self._pending:
+            queues = ", ".join(f"{name} ({count})" for name, count in sorted(stalled.items()))
+            raise RuntimeError(f"Messages are waiting on queues without a consumer: {queues}")
+
+    async def close(self) -> None:
+        self._queues.clear()
+        self._bindings.clear()
+
+
+class LocalStorage:
+    def __init__(self, root: Path | None = None) -> None:
+        self.settings = get_settings()
+        self.bucket = self.settings.s3_bucket
+        self.root = root or Path(self.settings.local_data_dir) / "storage"
+        self.stats = {
+            "uploads": 0,
+            "downloads": 0,
+            "bytes_uploaded": 0,
+            "bytes_downloaded": 0,
+            "streamed": 0,
+        }
+
+    def _count(self, direction: str, size: int) -> None:
+        self.stats[f"{direction}s"] += 1
+        self.stats[f"bytes_{direction}ed"] += size
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    async def upload_file(self, path: Path, key: str, content_type: str) -> None:
+        await place_file(path, self.path_for(key))
+        self._count("upload", path.stat().st_size)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str) -> None:
+        target = self.path_for(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = staging_path(target)
+        staging.write_bytes(data)
+        os.replace(staging, target)
+        self._count("upload", len(data))
+
+    async def upload_directory(
+        self,
+        directory: Path,
+        prefix: str,
+        content_types: dict[str, str],
+        *,
+        manifest: str | None = None,
+    ) -> UploadStats:
+        return await upload_directory_with(
+            self.upload_file,
+            directory,
+            prefix,
+            content_types,
+            manifest=manifest,
+            concurrency=self.settings.s3_upload_concurrency,
+            retries=0,
+        )
+
+    async def download_file(self, key: str, target: Path) -> None:
+        await place_file(self.path_for(key), target)
+        self._count("download", target.stat().st_size)
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        try:
+            data = self.path_for(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        self._count("download", len(data))
+        return data
+
+    async def media_input(self, key: str, target: Path) -> str:
+        # In presigned mode the stored file is read in place, the local stand-in for a URL.
+        if self.settings.media_input_mode == "download":
+            await self.download_file(key, target)
+            return str(target)
+        self.stats["streamed"] += 1
+        return str(self.path_for(key))
+
+    async def object_exists(self, key: str) -> bool:
+        return self.path_for(key).is_file()
+
+
+class LocalEvents:
+    def __init__(self) -> None:
+        self._subscribers: dict[str, list[asyncio.Queue[dict[str, Any]]]] = {}
+
+    def subscribe(self, job_id: str) -> asyncio.Queue[dict[str, Any]]:
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue[dict[str, Any]]) -> None:
+        subscribers = self._subscribers.get(job_id, [])
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def publish(self, payload: dict[str, Any]) -> None:
+        logger.debug("job event %s", payload)
+        for queue in self._subscribers.get(payload["job_id"], []):
+            queue.put_nowait(payload)
+
+
+local_events = LocalEvents()
+
+
+async def publish_local_job_event(
+    job_id: str,
+    stage: str,
+    status: str,
+    lang: str | None = None,
+    progress: float = 0.0,
+    message: str | None = None,
+) -> None:
+    local_events.publish(build_job_event(job_id, stage, status, lang, progress, message))
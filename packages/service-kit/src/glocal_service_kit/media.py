@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import statistics
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from glocal_service_kit.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+HLS_SEGMENT_SECONDS = 2
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+HLS_MANIFEST = "index.m3u8"
+HLS_CONTENT_TYPES = {".m3u8": "application/x-mpegURL", ".ts": "video/mp2t"}
+KEYFRAME_PROBE_SECONDS = 30
+PROBE_FORMAT_FIELDS = "format_name,duration,size,bit_rate"
+PROBE_STREAM_FIELDS = (
+    "index,codec_type,codec_name,profile,pix_fmt,width,height,avg_frame_rate,"
+    "sample_rate,channels,channel_layout"
+)
+STDERR_TAIL_LINES = 20
+
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+
+@dataclass
+class FfmpegRun:
+    seconds: float = 0.0
+    frames: int = 0
+    fps: float = 0.0
+    speed: float = 0.0
+    out_time_s: float = 0.0
+
+    def update(self, fields: dict[str, str]) -> None:
+        # out_time_ms is in microseconds too; ffmpeg kept the misleading name for compatibility.
+        out_time_us = _number(fields.get("out_time_us") or fields.get("out_time_ms"), int)
+        if out_time_us is not None and out_time_us >= 0:
+            self.out_time_s = out_time_us / 1e6
+        self.frames = _number(fields.get("frame"), int) or self.frames
+        self.fps = _number(fields.get("fps")) or self.fps
+        self.speed = _number(fields.get("speed", "").rstrip("x")) or self.speed
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "frames": self.frames,
+            "fps": round(self.fps, 2),
+            "speed": round(self.speed, 3),
+            "out_time_s": round(self.out_time_s, 3),
+        }
+
+
+async def _collect_tail(stream: asyncio.StreamReader, tail: deque[str]) -> None:
+    async for line in stream:
+        tail.append(line.decode("utf-8", "replace").rstrip())
+
+
+async def run_ffmpeg(
+    command: list[str],
+    *,
+    duration: float | None = None,
+    on_progress: ProgressCallback | None = None,
+    timeout: float | None = None,
+) -> FfmpegRun:
+    settings = get_settings()
+    timeout = settings.ffmpeg_timeout_seconds if timeout is None else timeout
+    run = FfmpegRun()
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        command[0],
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        *command[1:],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = process.stdout, process.stderr
+    assert stdout is not None and stderr is not None
+    stderr_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def follow_progress() -> None:
+        fields: dict[str, str] = {}
+        last_report = float("-inf")
+        async for line in stdout:
+            key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+            if key != "progress":
+                fields[key] = value
+                continue
+            run.update(fields)
+            now = time.monotonic()
+            due = value == "end" or now - last_report >= settings.ffmpeg_progress_interval_seconds
+            if on_progress is None or not duration or not due:
+                continue
+            last_report = now
+            try:
+                await on_progress(min(run.out_time_s / duration, 1.0))
+            except Exception as exc:  # pragma: no cover - progress is best effort
+                logger.warning("ffmpeg progress callback failed: %s", exc)
+
+    stderr_reader = asyncio.ensure_future(_collect_tail(stderr, stderr_tail))
+    try:
+        # stdout closes when ffmpeg exits, so the timeout covers the whole run.
+        await asyncio.wait_for(follow_progress(), timeout or None)
+        returncode = await process.wait()
+        await stderr_reader
+    except asyncio.TimeoutError:
+        stderr_reader.cancel()
+        await _kill(process)
+        raise TimeoutError(f"ffmpeg did not finish within {timeout}s") from None
+    except BaseException:
+        # Cancellation of the calling task must not leave an orphaned encode behind.
+        stderr_reader.cancel()
+        await _kill(process)
+        raise
+    run.seconds = round(time.perf_counter() - started, 3)
+    if returncode != 0:
+        logger.error("ffmpeg exited with %s:\n%s", returncode, "\n".join(stderr_tail))
+        raise subprocess.CalledProcessError(returncode, command, stderr="\n".join(stderr_tail))
+    return run
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+
+
+async def ffprobe(args: list[str]) -> str:
+    result = await asyncio.to_thread(
+        subprocess.run,
+        ["ffprobe", "-v", "error", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def _number(value: Any, kind: type = float) -> Any:
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value: str | None) -> float | None:
+    numerator, _, denominator = (value or "").partition("/")
+    rate: float | None = _number(numerator)
+    if rate is None or not denominator:
+        return rate
+    divisor = _number(denominator)
+    return round(rate / divisor, 3) if divisor else None
+
+
+async def media_duration(source: str) -> float | None:
+    output = await ffprobe(
+        [
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            source,
+        ]
+    )
+    duration: float | None = _number(output.strip())
+    return duration
+
+
+async def keyframe_intervals(
+    source: str, seconds: int = KEYFRAME_PROBE_SECONDS
+) -> dict[str, float | None]:
+    # Packet flags come from the demuxer, so only the first seconds are read and nothing is decoded.
+    output = await ffprobe(
+        [
+            "-select_streams",
+            "v:0",
+            "-read_intervals",
+            f"%+{seconds}",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            source,
+        ]
+    )
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and (value := _number(pts_time)) is not None:
+            times.append(value)
+    gaps = [later - earlier for earlier, later in itertools.pairwise(times)]
+    # The median is the typical GOP; the maximum is what decides whether every HLS segment
+    # can start on a keyframe.
+    return {
+        "keyframe_interval": round(statistics.median(gaps), 3) if gaps else None,
+        "max_keyframe_interval": round(max(gaps), 3) if gaps else None,
+    }
+
+
+async def probe_source(source: str) -> dict[str, Any]:
+    data = json.loads(
+        await ffprobe(
+            [
+                "-show_entries",
+                f"format={PROBE_FORMAT_FIELDS}:stream={PROBE_STREAM_FIELDS}",
+                "-of",
+                "json",
+                source,
+            ]
+        )
+    )
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    probe: dict[str, Any] = {
+        "format_name": fmt.get("format_name"),
+        "duration": _number(fmt.get("duration")),
+        "size": _number(fmt.get("size"), int),
+        "bit_rate": _number(fmt.get("bit_rate"), int),
+        "streams": [
+            {
+                "index": s.get("index"),
+                "type": s.get("codec_type"),
+                "codec": s.get("codec_name"),
+            }
+            for s in streams
+        ],
+        "video": None,
+        "audio": None,
+    }
+    if video is not None:
+        probe["video"] = {
+            "codec_name": video.get("codec_name"),
+            "profile": video.get("profile"),
+            "pix_fmt": video.get("pix_fmt"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "frame_rate": _frame_rate(video.get("avg_frame_rate")),
+            **await keyframe_intervals(source),
+        }
+    if audio is not None:
+        probe["audio"] = {
+            "codec_name": audio.get("codec_name"),
+            "sample_rate": _number(audio.get("sample_rate"), int),
+            "channels": audio.get("channels"),
+            "channel_layout": audio.get("channel_layout"),
+        }
+    return probe
+
+
+def ffmpeg_input(source: str) -> list[str]:
+    if source.startswith(("http://", "https://")):
+        # Survive dropped connections mid-transfer instead of failing the whole pass.
+        return [
+            "-reconnect",
+            "1",
+            "-reconnect_streamed",
+            "1",
+            "-reconnect_delay_max",
+            "5",
+            "-i",
+            source,
+        ]
+    return ["-i", source]
+
+
+def keyframe_args(seconds: int = HLS_SEGMENT_SECONDS) -> list[str]:
+    # A keyframe on every segment boundary lets HLS be cut from the same encode.
+    return ["-force_key_frames", f"expr:gte(t,n_forced*{seconds})"]
+
+
+def localized_text(lang: str) -> str:
+    return f"[Localized TEXT {lang}]"
+
+
+def text_overlay_filter(text: str) -> str:
+    return (
+        f"drawtext=fontfile={FONT_PATH}:text='{text}':"
+        "fontcolor=white:fontsize=48:x=40:y=40:box=1:boxcolor=black@0.45"
+    )
+
+
+def mp4_and_hls_output(
+    output_mp4: Path,
+    hls_dir: Path,
+    segment_seconds: int = HLS_SEGMENT_SECONDS,
+) -> list[str]:
+    # The tee muxer writes both renditions from one set of encoded packets, so the HLS
+    # preview costs no extra encode and no extra generation of quality loss.
+    hls_options = ":".join(
+        [
+            "f=hls",
+            f"hls_time={segment_seconds}",
+            "hls_list_size=0",
+            "start_number=0",
+            f"hls_segment_filename={hls_dir / 'segment_%03d.ts'}",
+            "bsfs/v=h264_mp4toannexb",
+        ]
+    )
+    return [
+        "-flags",
+        "+global_header",
+        "-f",
+        "tee",
+        f"[f=mp4:movflags=+faststart]{output_mp4}|[{hls_options}]{hls_dir / HLS_MANIFEST}",
+    ]
+
+
+def hls_remux_command(
+    output_mp4: Path,
+    hls_dir: Path,
+    segment_seconds: int = HLS_SEGMENT_SECONDS,
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(output_mp4),
+        "-c",
+        "copy",
+        "-start_number",
+        "0",
+        "-hls_time",
+        str(segment_seconds),
+        "-hls_list_size",
+        "0",
+        "-hls_segment_filename",
+        str(hls_dir / "segment_%03d.ts"),
+        str(hls_dir / HLS_MANIFEST),
+    ]
+
+
+def trim_args(duration: float | None, pad_audio: bool = False) -> list[str]:
+    # Cut at the picture's length explicitly, padding a short dub with silence: with
+    # -shortest, apad never ends and the tee muxer never finalizes the MP4.
+    if not duration:
+        return []
+    return [*(["-af", "apad"] if pad_audio else []), "-t", f"{duration:.3f}"]
+
+
+async def write_mp4_and_hls(
+    command: list[str],
+    output_mp4: Path,
+    hls_dir: Path,
+    *,
+    duration: float | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> FfmpegRun:
+    # command is the ffmpeg invocation up to, not including, the output.
+    if get_settings().hls_single_pass:
+        return await run_ffmpeg(
+            [*command, *mp4_and_hls_output(output_mp4, hls_dir)],
+            duration=duration,
+            on_progress=on_progress,
+        )
+    run = await run_ffmpeg(
+        [*command, "-movflags", "+faststart", str(output_mp4)],
+        duration=duration,
+        on_progress=on_progress,
+    )
+    remux = await run_ffmpeg(hls_remux_command(output_mp4, hls_dir))
+    run.seconds = round(run.seconds + remux.seconds, 3)
+    return run
@@ -1,21 +1,73 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from typing import Any, Awaitable, Callable
+import logging
+from typing import Any, Awaitable, Callable, Iterable
 
 import aio_pika
 
+from glocal_service_kit.codec import codec_for_content_type, get_codec
 from glocal_service_kit.config import get_settings
 
 MessageHandler = Callable[[dict[str, Any]], Awaitable[None]]
 
+logger = logging.getLogger(__name__)
+
+
+class HandlerPool:
+    def __init__(self, limit: int, order_key: str | None, name: str) -> None:
+        self.order_key = order_key
+        self.name = name
+        self._slots = asyncio.Semaphore(limit)
+        self._tails: dict[Any, asyncio.Future[None]] = {}
+        self._in_flight: set[asyncio.Task[None]] = set()
+
+    async def submit(self, payload: dict[str, Any], work: Awaitable[None]) -> None:
+        await self._slots.acquire()
+        key = payload.get(self.order_key) if self.order_key else None
+        previous: asyncio.Future[None] | None = None
+        done: asyncio.Future[None] | None = None
+        if key is not None:
+            previous = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+        task = asyncio.create_task(self._run(work, previous, done, key))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _run(
+        self,
+        work: Awaitable[None],
+        previous: asyncio.Future[None] | None,
+        done: asyncio.Future[None] | None,
+        key: Any,
+    ) -> None:
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            await work
+        except Exception:
+            logger.exception("Handler failed for message on %s", self.name)
+        finally:
+            self._slots.release()
+            if done is not None:
+                done.set_result(None)
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    async def drain(self) -> None:
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
 
 class RabbitMQ:
     def __init__(self) -> None:
         self.settings = get_settings()
+        self.codec = get_codec(self.settings.message_codec)
         self._connection: aio_pika.RobustConnection | None = None
         self._channel: aio_pika.abc.AbstractChannel | None = None
+        self._exchanges: dict[str, aio_pika.abc.AbstractExchange] = {}
+        self._queues: dict[str, aio_pika.abc.AbstractQueue] = {}
         self._lock = asyncio.Lock()
 
     async def _ensure_channel(self) -> aio_pika.abc.AbstractChannel:
@@ -23,29 +75,81 @@ class RabbitMQ:
             if self._channel and not self._channel.is_closed:
                 return self._channel
             self._connection = await aio_pika.connect_robust(self.settings.rabbitmq_url)
-            self._channel = await self._connection.channel()
-            await self._channel.set_qos(prefetch_count=5)
+            self._channel = await self._connection.channel(
+                publisher_confirms=self.settings.rabbitmq_publisher_confirms,
+            )
+            await self._channel.set_qos(prefetch_count=self.settings.rabbitmq_prefetch)
+            # Declarations belong to the channel; a new channel starts with an empty cache.
+            self._exchanges.clear()
+            self._queues.clear()
             return self._channel
 
-    async def declare_queue(self, name: str, routing_key: str, exchange: str = "jobs") -> None:
+    async def _get_exchange(self, name: str) -> aio_pika.abc.AbstractExchange:
         channel = await self._ensure_channel()
-        ex = await channel.declare_exchange(
-            exchange,
-            aio_pika.ExchangeType.TOPIC,
-            durable=True,
-        )
-        queue = await channel.declare_queue(name, durable=True)
+        exchange = self._exchanges.get(name)
+        if exchange is None:
+            exchange = await channel.declare_exchange(
+                name,
+                aio_pika.ExchangeType.TOPIC,
+                durable=True,
+            )
+            self._exchanges[name] = exchange
+        return exchange
+
+    async def _get_queue(self, name: str) -> aio_pika.abc.AbstractQueue:
+        channel = await self._ensure_channel()
+        queue = self._queues.get(name)
+        if queue is None:
+            queue = await channel.declare_queue(name, durable=True)
+            self._queues[name] = queue
+        return queue
+
+    async def declare_queue(self, name: str, routing_key: str, exchange: str = "jobs") -> None:
+        ex = await self._get_exchange(exchange)
+        queue = await self._get_queue(name)
         await queue.bind(ex, routing_key)
 
-    async def consume(self, queue_name: str, handler: MessageHandler) -> None:
+    async def consume(
+        self,
+        queue_name: str,
+        handler: MessageHandler,
+        *,
+        concurrency: int = 1,
+        order_key: str | None = None,
+    ) -> None:
+        limit = self.settings.consumer_concurrency or concurrency
         channel = await self._ensure_channel()
-        queue = await channel.declare_queue(queue_name, durable=True)
+        if limit > self.settings.rabbitmq_prefetch:
+            await channel.set_qos(prefetch_count=limit)
+        queue = await self._get_queue(queue_name)
+
+        if limit <= 1:
+            async with queue.iterator() as queue_iter:
+                async for message in queue_iter:
+                    payload = await self.decode_or_reject(message, queue_name)
+                    if payload is None:
+                        continue
+                    async with message.process():
+                        await handler(payload)
+            return
+
+        pool = HandlerPool(limit, order_key, queue_name)
+
+        async def process(
+            message: aio_pika.abc.AbstractIncomingMessage,
+            payload: dict[str, Any],
+        ) -> None:
+            async with message.process():
+                await handler(payload)
 
-        async with queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                async with message.process():
-                    payload = json.loads(message.body.decode("utf-8"))
-                    await handler(payload)
+        try:
+            async with queue.iterator() as queue_iter:
+                async for message in queue_iter:
+                    payload = await self.decode_or_reject(message, queue_name)
+                    if payload is not None:
+                        await pool.submit(payload, process(message, payload))
+        finally:
+            await pool.drain()
 
     async def publish(
         self,
@@ -53,13 +157,53 @@ class RabbitMQ:
         payload: dict[str, Any],
         exchange: str = "jobs",
     ) -> None:
-        channel = await self._ensure_channel()
-        ex = await channel.declare_exchange(exchange, aio_pika.ExchangeType.TOPIC, durable=True)
-        await ex.publish(
-            aio_pika.Message(body=json.dumps(payload).encode("utf-8")),
-            routing_key=routing_key,
+        ex = await self._get_exchange(exchange)
+        await ex.publish(self.encode(payload), routing_key=routing_key)
+
+    async def publish_batch(
+        self,
+        messages: Iterable[tuple[str, dict[str, Any]]],
+        exchange: str = "jobs",
+    ) -> None:
+        batch = list(messages)
+        if not batch:
+            return
+        ex = await self._get_exchange(exchange)
+        # With publisher confirms on, the broker acks are awaited together rather than one by one.
+        await asyncio.gather(
+            *(
+                ex.publish(self.encode(payload), routing_key=routing_key)
+                for routing_key, payload in batch
+            )
+        )
+
+    def encode(self, payload: dict[str, Any]) -> aio_pika.Message:
+        return aio_pika.Message(
+            body=self.codec.encode(payload),
+            content_type=self.codec.content_type,
         )
 
+    def decode(self, message: aio_pika.abc.AbstractIncomingMessage) -> dict[str, Any]:
+        return codec_for_content_type(message.content_type).decode(message.body)
+
+    async def decode_or_reject(
+        self,
+        message: aio_pika.abc.AbstractIncomingMessage,
+        queue_name: str,
+    ) -> dict[str, Any] | None:
+        # A payload that cannot be decoded never will be: drop it instead of stopping the
+        # consumer or leaving it unacked to be redelivered forever.
+        try:
+            return self.decode(message)
+        except Exception:
+            logger.exception(
+                "Rejecting undecodable message on %s (content type %r)",
+                queue_name,
+                message.content_type,
+            )
+            await message.reject(requeue=False)
+            return None
+
     async def close(self) -> None:
         if self._channel is not None:
             await self._channel.close()
@@ -67,6 +211,8 @@ class RabbitMQ:
         if self._connection is not None:
             await self._connection.close()
             self._connection = None
+        self._exchanges.clear()
+        self._queues.clear()
 
 
 rabbitmq = RabbitMQ()
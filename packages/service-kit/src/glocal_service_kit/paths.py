@@ -3,9 +3,22 @@ from __future__ import annotations
 from pathlib import Path
 
 
+def job_key(job_id: str, *parts: str) -> str:
+    return str(Path("jobs") / job_id / Path(*parts))
+
+
 def job_stage_key(job_id: str, lang: str, *parts: str) -> str:
     return str(Path("jobs") / job_id / lang / Path(*parts))
 
 
 def job_stage_local(job_id: str, lang: str, *parts: str, base: Path) -> Path:
     return base / job_id / lang / Path(*parts)
+
+
+def content_key(namespace: str, digest: str, suffix: str) -> str:
+    # Content-addressed: identical content maps to one object however often it is produced.
+    return str(Path(namespace) / digest[:2] / f"{digest}{suffix}")
+
+
+def analysis_key(digest: str, suffix: str) -> str:
+    return content_key("analysis", digest, suffix)
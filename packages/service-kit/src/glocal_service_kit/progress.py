@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import json
 from datetime import datetime, timezone
+from typing import Any
 
 from redis.asyncio import Redis
 
@@ -23,16 +24,15 @@ async def _get_redis() -> Redis:
     return _redis
 
 
-async def publish_job_event(
+def build_job_event(
     job_id: str,
     stage: str,
     status: str,
     lang: str | None = None,
     progress: float = 0.0,
     message: str | None = None,
-) -> None:
-    redis = await _get_redis()
-    payload = {
+) -> dict[str, Any]:
+    return {
         "job_id": job_id,
         "stage": stage,
         "status": status,
@@ -41,4 +41,16 @@ async def publish_job_event(
         "message": message,
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
+
+
+async def publish_job_event(
+    job_id: str,
+    stage: str,
+    status: str,
+    lang: str | None = None,
+    progress: float = 0.0,
+    message: str | None = None,
+) -> None:
+    redis = await _get_redis()
+    payload = build_job_event(job_id, stage, status, lang, progress, message)
     await redis.publish(f"job:{job_id}", json.dumps(payload))
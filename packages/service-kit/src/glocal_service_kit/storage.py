@@ -1,55 +1,322 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Awaitable, Callable
 
-import boto3
+import aioboto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.exceptions import ClientError
 
+from glocal_service_kit.cache import artifact_cache_from_settings
 from glocal_service_kit.config import get_settings
 
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+RETRY_BACKOFF_SECONDS = 0.2
+DOWNLOAD_ATTEMPTS = 3
+PRECONDITION_FAILED = ("PreconditionFailed", "412")
+NOT_FOUND = ("404", "NoSuchKey", "NotFound")
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+UploadFile = Callable[[Path, str, str], Awaitable[None]]
+
+
+def error_code(exc: ClientError) -> str:
+    return str(exc.response.get("Error", {}).get("Code", ""))
+
+
+@dataclass
+class UploadStats:
+    files: int = 0
+    bytes: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput_mbps(self) -> float:
+        return self.bytes * 8 / self.seconds / 1e6 if self.seconds else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 3),
+            "throughput_mbps": round(self.throughput_mbps, 2),
+        }
+
+
+async def upload_directory_with(
+    upload_file: UploadFile,
+    directory: Path,
+    prefix: str,
+    content_types: dict[str, str],
+    *,
+    manifest: str | None,
+    concurrency: int,
+    retries: int,
+) -> UploadStats:
+    stats = UploadStats()
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def upload(path: Path) -> None:
+        key = f"{prefix.rstrip('/')}/{path.name}"
+        content_type = content_types.get(path.suffix, DEFAULT_CONTENT_TYPE)
+        async with slots:
+            for attempt in range(retries + 1):
+                try:
+                    await upload_file(path, key, content_type)
+                    break
+                except Exception:
+                    if attempt == retries:
+                        raise
+                    stats.retries += 1
+                    logger.warning("Retrying upload of %s (attempt %d)", key, attempt + 1)
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2**attempt)
+        stats.files += 1
+        stats.bytes += path.stat().st_size
+
+    started = time.perf_counter()
+    files = sorted(path for path in directory.iterdir() if path.is_file())
+    # The manifest goes last so readers never see a playlist pointing at missing segments.
+    tasks = [asyncio.ensure_future(upload(path)) for path in files if path.name != manifest]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # On the first failure the caller removes the directory, so no sibling may still be
+        # reading from it or pushing segments after the stage has failed.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if manifest is not None and (directory / manifest).is_file():
+        await upload(directory / manifest)
+    stats.seconds = time.perf_counter() - started
+    return stats
+
 
 class S3Storage:
     def __init__(self) -> None:
-        settings = get_settings()
-        self.bucket = settings.s3_bucket
-        self.client = boto3.client(
-            "s3",
-            endpoint_url=settings.s3_endpoint,
-            region_name=settings.s3_region,
-            aws_access_key_id=settings.s3_access_key,
-            aws_secret_access_key=settings.s3_secret_key,
-            config=Config(signature_version="s3v4"),
+        self.settings = get_settings()
+        self.bucket = self.settings.s3_bucket
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.settings.s3_multipart_threshold_mb * MB,
+            multipart_chunksize=self.settings.s3_multipart_chunksize_mb * MB,
+            max_concurrency=self.settings.s3_max_concurrency,
         )
+        self.cache = artifact_cache_from_settings()
+        self._client: Any | None = None
+        self._client_lock = asyncio.Lock()
+        self._exit_stack = AsyncExitStack()
+
+    async def client(self) -> Any:
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    session = aioboto3.Session()
+                    self._client = await self._exit_stack.enter_async_context(
+                        session.client(
+                            "s3",
+                            endpoint_url=self.settings.s3_endpoint,
+                            region_name=self.settings.s3_region,
+                            aws_access_key_id=self.settings.s3_access_key,
+                            aws_secret_access_key=self.settings.s3_secret_key,
+                            config=Config(
+                                signature_version="s3v4",
+                                max_pool_connections=self.settings.s3_max_pool_connections,
+                            ),
+                        )
+                    )
+        assert self._client
+        return self._client
+
+    async def close(self) -> None:
+        await self._exit_stack.aclose()
+        self._client = None
 
     async def upload_file(self, path: Path, key: str, content_type: str) -> None:
-        await asyncio.to_thread(
-            self.client.upload_file,
+        client = await self.client()
+        if path.stat().st_size < self.transfer_config.multipart_threshold:
+            # A single PUT; multipart would cost three requests for e.g. an HLS segment.
+            body = await asyncio.to_thread(path.read_bytes)
+            await client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=body,
+                ContentType=content_type,
+            )
+            return
+        await client.upload_file(
             str(path),
             self.bucket,
             key,
             ExtraArgs={"ContentType": content_type},
+            Config=self.transfer_config,
         )
 
     async def upload_bytes(self, data: bytes, key: str, content_type: str) -> None:
-        await asyncio.to_thread(
-            self.client.put_object,
+        client = await self.client()
+        await client.put_object(
             Bucket=self.bucket,
             Key=key,
             Body=data,
             ContentType=content_type,
         )
 
+    async def upload_directory(
+        self,
+        directory: Path,
+        prefix: str,
+        content_types: dict[str, str],
+        *,
+        manifest: str | None = None,
+    ) -> UploadStats:
+        return await upload_directory_with(
+            self.upload_file,
+            directory,
+            prefix,
+            content_types,
+            manifest=manifest,
+            concurrency=self.settings.s3_upload_concurrency,
+            retries=self.settings.s3_upload_retries,
+        )
+
     async def download_file(self, key: str, target: Path) -> None:
         target.parent.mkdir(parents=True, exist_ok=True)
-        await asyncio.to_thread(self.client.download_file, self.bucket, key, str(target))
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                await self._download_version(key, target)
+                return
+            except ClientError as exc:
+                if error_code(exc) not in PRECONDITION_FAILED or attempt == DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                # Overwritten since the HEAD: start over from the new version's ETag.
+                logger.warning("%s changed during download, retrying", key)
+
+    async def _download_version(self, key: str, target: Path) -> None:
+        if self.cache is None:
+            # Nothing needs the size or ETag up front; the first GET reports both.
+            await self._download(key, target)
+            return
+        client = await self.client()
+        head = await client.head_object(Bucket=self.bucket, Key=key)
+        size = head["ContentLength"]
+        etag = head.get("ETag", "").strip('"')
+        if etag and self.cache.accepts(size):
+            await self.cache.fetch(
+                self.bucket,
+                key,
+                etag,
+                size,
+                target,
+                lambda staging: self._download(key, staging, size, etag),
+            )
+            return
+        await self._download(key, target, size, etag)
+
+    async def _download(
+        self,
+        key: str,
+        target: Path,
+        size: int | None = None,
+        etag: str = "",
+    ) -> None:
+        client = await self.client()
+        config = self.transfer_config
+        slots = asyncio.Semaphore(config.max_request_concurrency)
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        async def fetch(first: int, last: int) -> dict[str, Any]:
+            extra = {"Range": f"bytes={first}-{last}"}
+            if etag:
+                # Every GET is pinned to one version, so a concurrent overwrite fails with 412
+                # instead of mixing versions or landing under the old ETag.
+                extra["IfMatch"] = f'"{etag}"'
+            offset = first
+            async with slots:
+                response = await client.get_object(Bucket=self.bucket, Key=key, **extra)
+                async with response["Body"] as body:
+                    async for data in body.iter_chunks(config.io_chunksize):
+                        # Disk writes go to a thread so large downloads never stall the loop.
+                        await asyncio.to_thread(os.pwrite, fd, data, offset)
+                        offset += len(data)
+            return dict(response)
+
+        try:
+            start = 0
+            if size is None:
+                # The first part doubles as the HEAD: its Content-Range carries the full size
+                # and its ETag pins the remaining parts.
+                try:
+                    response = await fetch(0, config.multipart_threshold - 1)
+                except ClientError as exc:
+                    if error_code(exc) == "InvalidRange":
+                        return  # empty object
+                    raise
+                content_range = response.get("ContentRange")
+                size = int(content_range.rsplit("/", 1)[1]) if content_range else 0
+                etag = response.get("ETag", "").strip('"')
+                start = config.multipart_threshold
+            # Large objects are fetched as parallel ranged GETs written in place.
+            chunk = config.multipart_chunksize if size >= config.multipart_threshold else size
+            if start < size:
+                await asyncio.gather(
+                    *(
+                        fetch(first, min(first + chunk, size) - 1)
+                        for first in range(start, size, chunk)
+                    )
+                )
+        finally:
+            os.close(fd)
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        # One GET straight into memory, for small objects where a HEAD and a file cost more
+        # than the transfer; None when the key does not exist.
+        client = await self.client()
+        try:
+            response = await client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if error_code(exc) in NOT_FOUND:
+                return None
+            raise
+        async with response["Body"] as body:
+            data: bytes = await body.read()
+        return data
+
+    async def presigned_url(self, key: str) -> str:
+        client = await self.client()
+        url = await client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.settings.media_url_expires_seconds,
+        )
+        return str(url)
+
+    async def media_input(self, key: str, target: Path) -> str:
+        # The two modes are exclusive: downloads go through the node-local artifact cache, so
+        # repeated reads of a source are served from disk; a presigned URL streams every read
+        # from S3 (header-only probes, encodes overlapping the transfer) and skips the cache.
+        if self.settings.media_input_mode == "presigned":
+            return await self.presigned_url(key)
+        await self.download_file(key, target)
+        return str(target)
 
     async def object_exists(self, key: str) -> bool:
+        client = await self.client()
         try:
-            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+            await client.head_object(Bucket=self.bucket, Key=key)
             return True
-        except self.client.exceptions.NoSuchKey:  # type: ignore[attr-defined]
-            return False
+        except ClientError as exc:
+            if error_code(exc) in NOT_FOUND:
+                return False
+            raise
 
 
 storage = S3Storage()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+os.environ.setdefault("RUNTIME_MODE", "local")
+os.environ.setdefault("POSTGRES_DSN", "postgresql://test@localhost/test")
+
+from glocal_service_kit import get_settings, keyframe_args, trim_args  # noqa: E402
+from glocal_service_kit.media import HLS_MANIFEST, write_mp4_and_hls  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+    reason="needs ffmpeg and ffprobe",
+)
+
+SOURCE_SECONDS = 8.0
+# One video frame at 25 fps plus one AAC frame of slack.
+TOLERANCE = 0.07
+
+
+def ffmpeg(*args: str) -> None:
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+
+def stream_spans(path: Path) -> dict[str, float]:
+    # First packet start to last packet end per stream type; works for MP4 and HLS alike.
+    output = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "packet=codec_type,pts_time,duration_time",
+            "-of",
+            "json",
+            str(path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    starts: dict[str, float] = {}
+    ends: dict[str, float] = {}
+    for packet in json.loads(output)["packets"]:
+        kind = packet["codec_type"]
+        start = float(packet["pts_time"])
+        end = start + float(packet.get("duration_time", 0))
+        starts[kind] = min(starts.get(kind, start), start)
+        ends[kind] = max(ends.get(kind, end), end)
+    return {kind: ends[kind] - starts[kind] for kind in starts}
+
+
+@pytest.fixture(scope="module")
+def media(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    root = tmp_path_factory.mktemp("media")
+    ffmpeg(
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=size=320x240:rate=25:duration={SOURCE_SECONDS}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=300:duration={SOURCE_SECONDS}",
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        *keyframe_args(),
+        "-c:a",
+        "aac",
+        str(root / "source.mp4"),
+    )
+    ffmpeg("-i", str(root / "source.mp4"), "-map", "0:v", "-c", "copy", str(root / "video.mp4"))
+    for name, seconds in (("short", 5), ("long", 11)):
+        dub = f"sine=frequency=500:duration={seconds}"
+        ffmpeg("-f", "lavfi", "-i", dub, str(root / f"{name}.wav"))
+    return root
+
+
+@pytest.fixture(params=[True, False], ids=["single-pass", "two-pass"])
+def hls_single_pass(request: pytest.FixtureRequest) -> Iterator[bool]:
+    settings = get_settings()
+    previous = settings.hls_single_pass
+    settings.hls_single_pass = request.param
+    yield request.param
+    settings.hls_single_pass = previous
+
+
+def assert_full_length(output_mp4: Path, hls_dir: Path) -> None:
+    for path in (output_mp4, hls_dir / HLS_MANIFEST):
+        spans = stream_spans(path)
+        assert set(spans) == {"video", "audio"}, path
+        for kind, span in spans.items():
+            assert span == pytest.approx(SOURCE_SECONDS, abs=TOLERANCE), (path, kind)
+
+
+@pytest.mark.parametrize("dub", ["short", "long"])
+def test_mix_output_matches_source(
+    media: Path, tmp_path: Path, hls_single_pass: bool, dub: str
+) -> None:
+    # The mix-agent command: shared picture copied, dub padded or cut to the picture.
+    output_mp4 = tmp_path / "out.mp4"
+    hls_dir = tmp_path / "hls"
+    hls_dir.mkdir()
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(media / "video.mp4"),
+        "-i",
+        str(media / f"{dub}.wav"),
+        "-map",
+        "0:v",
+        "-map",
+        "1:a?",
+        "-c:v",
+        "copy",
+        "-c:a",
+        "aac",
+        *trim_args(SOURCE_SECONDS, pad_audio=True),
+    ]
+    asyncio.run(write_mp4_and_hls(command, output_mp4, hls_dir, duration=SOURCE_SECONDS))
+    assert_full_length(output_mp4, hls_dir)
+
+
+def test_overlay_output_matches_source(media: Path, tmp_path: Path, hls_single_pass: bool) -> None:
+    # The textinframe-agent command without the drawtext filter: picture re-encoded, audio copied.
+    output_mp4 = tmp_path / "out.mp4"
+    hls_dir = tmp_path / "hls"
+    hls_dir.mkdir()
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(media / "source.mp4"),
+        "-map",
+        "0:v",
+        "-map",
+        "0:a?",
+        "-c:v",
+        "libx264",
+        *keyframe_args(),
+        "-c:a",
+        "copy",
+    ]
+    asyncio.run(write_mp4_and_hls(command, output_mp4, hls_dir, duration=SOURCE_SECONDS))
+    assert_full_length(output_mp4, hls_dir)
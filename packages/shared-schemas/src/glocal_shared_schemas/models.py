@@ -69,6 +69,7 @@ class JobStatus(str, Enum):
 
 class LocalizationStage(str, Enum):
     asr = "asr"
+    video = "video"
     translate = "translate"
     tts = "tts"
     mix = "mix"
@@ -82,6 +83,8 @@ class JobOption(BaseModel):
     subs: bool = True
     dub: bool = True
     replace_text_in_frame: bool = False
+    # Burn the overlay in during the mix encode instead of a separate textinframe pass.
+    fuse_text_in_frame: bool = True
     upload_to_youtube: bool = False
 
 
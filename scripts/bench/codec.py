@@ -0,0 +1,120 @@
+"""Encode/decode cost of a representative orchestrator stage payload per message codec.
+
+Usage: PYTHONPATH=packages/service-kit/src python scripts/bench/codec.py [--iterations N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict
+
+# Importing the service kit builds its settings; nothing here connects to anything.
+os.environ.setdefault("RUNTIME_MODE", "local")
+os.environ.setdefault("POSTGRES_DSN", "postgresql://bench@localhost/bench")
+
+from glocal_service_kit.codec import CODECS  # noqa: E402
+
+
+def stage_payload() -> Dict[str, Any]:
+    # Mirrors the orchestrator's stage_message, with source_descriptor after a full ingest.
+    job_id = str(uuid.uuid4())
+    digest = hashlib.sha256(job_id.encode("utf-8")).hexdigest()
+    return {
+        "job_id": job_id,
+        "project_id": str(uuid.uuid4()),
+        "variant_id": str(uuid.uuid4()),
+        "lang": "pt-BR",
+        "stage": "tts",
+        "source": {
+            "key": f"raw/{uuid.uuid4()}/{uuid.uuid4()}/source.mp4",
+            "type": "video",
+            "probe": {
+                "format_name": "mov,mp4,m4a,3gp,3g2,mj2",
+                "duration": 30.016,
+                "size": 11_482_931,
+                "bit_rate": 3_060_480,
+                "streams": [
+                    {"index": 0, "type": "video", "codec": "h264"},
+                    {"index": 1, "type": "audio", "codec": "aac"},
+                ],
+                "video": {
+                    "codec_name": "h264",
+                    "profile": "High",
+                    "pix_fmt": "yuv420p",
+                    "width": 1920,
+                    "height": 1080,
+                    "frame_rate": 29.97,
+                    "keyframe_interval": 2.002,
+                    "max_keyframe_interval": 2.002,
+                },
+                "audio": {
+                    "codec_name": "aac",
+                    "sample_rate": 48000,
+                    "channels": 2,
+                    "channel_layout": "stereo",
+                },
+            },
+            "analysis_audio_key": f"analysis/{digest[:2]}/{digest}.flac",
+        },
+        "options": {
+            "subs": True,
+            "dub": True,
+            "replace_text_in_frame": False,
+            "fuse_text_in_frame": True,
+            "upload_to_youtube": False,
+        },
+        "base_prefix": f"jobs/{job_id}/pt-BR",
+        "expect_tts": True,
+        "voice_profile": {
+            "id": str(uuid.uuid4()),
+            "name": "Female 25-35",
+            "provider": "xtts",
+            "provider_params": {"gender": "female", "age_range": "25-35", "style": "bright"},
+        },
+    }
+
+
+def measure(iterations: int) -> Dict[str, Dict[str, float]]:
+    payload = stage_payload()
+    results: Dict[str, Dict[str, float]] = {}
+    for name, codec in CODECS.items():
+        body = codec.encode(payload)
+        assert codec.decode(body) == payload
+        started = time.perf_counter()
+        for _ in range(iterations):
+            codec.encode(payload)
+        encode_us = (time.perf_counter() - started) / iterations * 1e6
+        started = time.perf_counter()
+        for _ in range(iterations):
+            codec.decode(body)
+        decode_us = (time.perf_counter() - started) / iterations * 1e6
+        results[name] = {
+            "content_type": codec.content_type,
+            "bytes": len(body),
+            "encode_us": round(encode_us, 3),
+            "decode_us": round(decode_us, 3),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    args = parser.parse_args()
+    results = measure(args.iterations)
+    print(f"{'codec':<10}{'bytes':>8}{'encode µs':>12}{'decode µs':>12}")
+    for name, row in results.items():
+        print(f"{name:<10}{row['bytes']:>8}{row['encode_us']:>12.3f}{row['decode_us']:>12.3f}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
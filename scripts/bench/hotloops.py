@@ -0,0 +1,377 @@
+"""Per-sample and per-segment hot loops in the workers, driven with realistic inputs.
+
+Covers tts-agent sine_wave, qc-agent analyze_audio and the SRT/VTT formatting in asr-agent
+and subs-agent. Inputs are deterministic, so outputs are comparable between runs.
+
+Timings are only comparable within one session on one machine. --against REF is the
+regression gate: it loads the services as of a git ref next to the working tree and times
+both alternately in the same process. --compare reports against a saved baseline without
+failing on timings, since a baseline from another session differs by noise alone.
+
+Usage: PYTHONPATH=packages/service-kit/src python scripts/bench/hotloops.py \
+    [--against REF | --compare scripts/bench/baselines/hotloops.json] \
+    [--save-baseline PATH] [--only PREFIX]
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import wave
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("RUNTIME_MODE", "local")
+# Only pure functions are exercised; the settings model still requires a DSN at import time.
+os.environ.setdefault("POSTGRES_DSN", "postgresql://bench@localhost/bench")
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICES_DIR = REPO_ROOT / "services"
+SAMPLE_RATE = 44100
+AUDIO_SECONDS = (30, 120)
+SEGMENT_COUNT = 1000
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_REPEAT = 7
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[], Any]
+    units: int
+    unit: str
+
+
+def load_service(name: str, services_dir: Path = SERVICES_DIR, tag: str = "") -> ModuleType:
+    module_name = f"bench_{tag}{name.replace('-', '_')}"
+    spec = importlib.util.spec_from_file_location(module_name, services_dir / name / "main.py")
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"Cannot load service {name}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_speech_like_wav(path: Path, seconds: int) -> None:
+    # Alternating 0.8s tones and 0.2s gaps, roughly what tts-agent produces for a transcript.
+    frames = array.array("h")
+    for second in range(seconds):
+        frequency = 220.0 + (second % 8) * 40
+        tone = [
+            int(16000 * math.sin(2 * math.pi * frequency * n / SAMPLE_RATE))
+            for n in range(int(SAMPLE_RATE * 0.8))
+        ]
+        frames.extend(tone)
+        frames.extend([0] * (SAMPLE_RATE - len(tone)))
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(frames.tobytes())
+
+
+def transcript(count: int) -> List[Dict[str, Any]]:
+    segments: List[Dict[str, Any]] = []
+    cursor = 0.0
+    for idx in range(count):
+        duration = 1.5 + (idx % 7) * 0.37
+        segments.append(
+            {
+                "id": idx,
+                "start": round(cursor, 3),
+                "end": round(cursor + duration, 3),
+                "text": f"Segment {idx}: launch campaigns with authentic multilingual voiceovers.",
+            }
+        )
+        cursor += duration + 0.25
+    return segments
+
+
+def tts_cases(tts: ModuleType, workdir: Path) -> List[Case]:
+    return [
+        Case(
+            f"tts.sine_wave[{seconds}s]",
+            lambda seconds=seconds: tts.sine_wave(440.0, seconds),
+            seconds * SAMPLE_RATE,
+            "sample",
+        )
+        for seconds in AUDIO_SECONDS
+    ]
+
+
+def qc_cases(qc: ModuleType, workdir: Path) -> List[Case]:
+    cases: List[Case] = []
+    for seconds in AUDIO_SECONDS:
+        wav_path = workdir / f"speech-{seconds}s.wav"
+        if not wav_path.exists():
+            write_speech_like_wav(wav_path, seconds)
+        cases.append(
+            Case(
+                f"qc.analyze_audio[{seconds}s]",
+                lambda path=wav_path: qc.analyze_audio(path),
+                seconds * SAMPLE_RATE,
+                "sample",
+            )
+        )
+    return cases
+
+
+def asr_cases(asr: ModuleType, workdir: Path) -> List[Case]:
+    segments = transcript(SEGMENT_COUNT)
+    timestamps = [float(seg["start"]) for seg in segments] + [float(seg["end"]) for seg in segments]
+    return [
+        Case(
+            f"asr.format_ts[{len(timestamps)}]",
+            lambda: [asr.format_ts(value) for value in timestamps],
+            len(timestamps),
+            "call",
+        ),
+        Case(
+            f"asr.segments_to_srt[{SEGMENT_COUNT}]",
+            lambda: asr.segments_to_srt(segments),
+            SEGMENT_COUNT,
+            "segment",
+        ),
+    ]
+
+
+def subs_cases(subs: ModuleType, workdir: Path) -> List[Case]:
+    segments = transcript(SEGMENT_COUNT)
+    timestamps = [float(seg["start"]) for seg in segments] + [float(seg["end"]) for seg in segments]
+    return [
+        Case(
+            f"subs.format_ts[{len(timestamps)}]",
+            lambda: [subs.format_ts(value) for value in timestamps],
+            len(timestamps),
+            "call",
+        ),
+        Case(
+            f"subs.to_srt[{SEGMENT_COUNT}]",
+            lambda: subs.to_srt(segments),
+            SEGMENT_COUNT,
+            "segment",
+        ),
+        Case(
+            f"subs.to_vtt[{SEGMENT_COUNT}]",
+            lambda: subs.to_vtt(segments),
+            SEGMENT_COUNT,
+            "segment",
+        ),
+    ]
+
+
+# Case name prefix -> (service, case builder).
+SUITES: Dict[str, Tuple[str, Callable[[ModuleType, Path], List[Case]]]] = {
+    "tts.": ("tts-agent", tts_cases),
+    "qc.": ("qc-agent", qc_cases),
+    "asr.": ("asr-agent", asr_cases),
+    "subs.": ("subs-agent", subs_cases),
+}
+
+
+def selected_suites(only: Optional[str]) -> List[str]:
+    # A suite is loaded only if --only can match one of its cases, so e.g. a subs-only run
+    # never imports the numpy-based services.
+    return [
+        prefix
+        for prefix in SUITES
+        if not only or prefix.startswith(only) or only.startswith(prefix)
+    ]
+
+
+def build_cases(
+    workdir: Path,
+    only: Optional[str],
+    services_dir: Path = SERVICES_DIR,
+    tag: str = "",
+) -> List[Case]:
+    cases: List[Case] = []
+    for prefix in selected_suites(only):
+        service, build = SUITES[prefix]
+        cases.extend(build(load_service(service, services_dir, tag), workdir))
+    return [case for case in cases if not only or case.name.startswith(only)]
+
+
+def checkout_services(ref: str, only: Optional[str], target: Path) -> Path:
+    # Only the service modules are taken from the ref; service-kit comes from the working tree.
+    for prefix in selected_suites(only):
+        service = SUITES[prefix][0]
+        source = subprocess.run(
+            ["git", "show", f"{ref}:services/{service}/main.py"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        path = target / service / "main.py"
+        path.parent.mkdir(parents=True)
+        path.write_text(source)
+    return target
+
+
+def digest(value: Any) -> str:
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    elif not isinstance(value, (bytes, bytearray)):
+        value = json.dumps(value, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(value).hexdigest()[:16]
+
+
+def summarize(case: Case, output: Any, loops: int, timings: List[float]) -> Dict[str, Any]:
+    best = min(timings)
+    return {
+        "best_ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "loops": loops,
+        f"ns_per_{case.unit}": round(best / case.units * 1e9, 2),
+        "output": digest(output),
+    }
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    output = case.run()
+    # Short cases run in a loop long enough (>= 0.2s) for timer noise not to matter.
+    timer = timeit.Timer(case.run)
+    loops, _ = timer.autorange()
+    timings = [elapsed / loops for elapsed in timer.repeat(repeat, loops)]
+    return summarize(case, output, loops, timings)
+
+
+def measure_pair(
+    current: Case, reference: Case, repeat: int
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Alternating the two runs spreads frequency scaling and background load over both.
+    outputs = (current.run(), reference.run())
+    timers = (timeit.Timer(current.run), timeit.Timer(reference.run))
+    loops, _ = timers[0].autorange()
+    timings: Tuple[List[float], List[float]] = ([], [])
+    for _ in range(repeat):
+        for timer, samples in zip(timers, timings, strict=True):
+            samples.append(timer.timeit(loops) / loops)
+    return (
+        summarize(current, outputs[0], loops, timings[0]),
+        summarize(reference, outputs[1], loops, timings[1]),
+    )
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float,
+    gate: bool,
+) -> bool:
+    # Without a gate slowdowns are only reported: the baseline's timings carry another
+    # session's noise.
+    ok = True
+    print(f"{'case':<32}{'baseline ms':>14}{'current ms':>14}{'speedup':>10}  note")
+    for name, row in results["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            print(f"{name:<32}{'-':>14}{row['best_ms']:>14.2f}{'-':>10}  new")
+            continue
+        speedup = previous["best_ms"] / row["best_ms"] if row["best_ms"] else float("inf")
+        notes = []
+        if speedup < 1 / threshold:
+            notes.append("REGRESSION" if gate else "slower")
+            ok = ok and not gate
+        if previous["output"] != row["output"]:
+            notes.append("output changed")
+        print(
+            f"{name:<32}{previous['best_ms']:>14.2f}{row['best_ms']:>14.2f}"
+            f"{speedup:>9.2f}x  {', '.join(notes)}"
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", help="run only cases whose name starts with this prefix")
+    parser.add_argument("--save-baseline", type=Path, help="write results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to report against")
+    parser.add_argument(
+        "--against",
+        metavar="REF",
+        help="git ref whose services are timed in the same run; slowdowns fail the run",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="slowdown factor reported as a regression when comparing",
+    )
+    args = parser.parse_args()
+
+    if args.against and args.compare:
+        parser.error("--against and --compare are mutually exclusive")
+
+    baseline: Optional[Dict[str, Any]] = None
+    with tempfile.TemporaryDirectory(prefix="glocal-hotloops-") as workdir:
+        cases = build_cases(Path(workdir), args.only)
+        results = {
+            "benchmark": "hotloops",
+            "environment": environment(),
+            "repeat": args.repeat,
+            "cases": {},
+        }
+        if args.against:
+            services_dir = checkout_services(args.against, args.only, Path(workdir) / "ref")
+            references = {
+                case.name: case
+                for case in build_cases(Path(workdir), args.only, services_dir, tag="ref_")
+            }
+            baseline = {"ref": args.against, "cases": {}}
+            for case in cases:
+                reference = references.get(case.name)
+                if reference is None:
+                    results["cases"][case.name] = measure(case, args.repeat)
+                    continue
+                current, previous = measure_pair(case, reference, args.repeat)
+                results["cases"][case.name] = current
+                baseline["cases"][case.name] = previous
+        else:
+            results["cases"] = {case.name: measure(case, args.repeat) for case in cases}
+
+    if baseline is not None:
+        ok = compare(results, baseline, args.threshold, gate=True)
+    elif args.compare:
+        ok = compare(results, json.loads(args.compare.read_text()), args.threshold, gate=False)
+    else:
+        ok = True
+        print(f"{'case':<32}{'best ms':>12}{'median ms':>12}{'per unit':>20}")
+        for name, row in results["cases"].items():
+            per_unit = next(f"{v:.2f} ns/{k[7:]}" for k, v in row.items() if k.startswith("ns_"))
+            print(f"{name:<32}{row['best_ms']:>12.2f}{row['median_ms']:>12.2f}{per_unit:>20}")
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
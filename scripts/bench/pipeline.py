@@ -0,0 +1,425 @@
+"""End-to-end pipeline throughput: N jobs x M languages through the orchestrator and every agent.
+
+All services run in one process on the local broker, storage and progress stand-ins
+(RUNTIME_MODE=local, see services/single-node) with an in-memory database, so only ffmpeg
+is required. Reports jobs per minute, per-queue latency percentiles split into queue wait and
+processing time, and bytes moved through object storage.
+
+Usage: PYTHONPATH=packages/service-kit/src python scripts/bench/pipeline.py --jobs 4 --langs es,de
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+os.environ["RUNTIME_MODE"] = "local"
+# The in-memory database below never connects; the settings model still requires a DSN.
+os.environ.setdefault("POSTGRES_DSN", "postgresql://bench@localhost/bench")
+
+import glocal_service_kit  # noqa: E402
+from glocal_service_kit import Database, LocalBroker, LocalStorage  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SINGLE_NODE = REPO_ROOT / "services" / "single-node" / "main.py"
+FINISHED_STATUSES = {"done", "partial", "error"}
+PERCENTILES = (50, 95, 99)
+
+
+class MemoryDatabase(Database):
+    def __init__(self) -> None:
+        super().__init__()
+        self.projects: Dict[str, Dict[str, Any]] = {}
+        self.assets: Dict[str, Dict[str, Any]] = {}
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.variants: Dict[str, Dict[str, Any]] = {}
+        self.finished_at: Dict[str, float] = {}
+        self.glossary: Dict[str, List[Dict[str, Any]]] = {}
+        self.translations: Dict[tuple, str] = {}
+
+    async def connect(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    async def fetch_asset(self, asset_id: str) -> dict | None:
+        asset = self.assets.get(asset_id)
+        return dict(asset) if asset else None
+
+    async def update_asset_meta(self, asset_id: str, meta: dict) -> None:
+        self.assets[asset_id]["meta"] = {**self.assets[asset_id]["meta"], **meta}
+
+    async def fetch_voice_profile(self, profile_id: str) -> dict | None:
+        return None
+
+    async def fetch_glossary(self, project_id: str) -> list[dict]:
+        return list(self.glossary.get(project_id, []))
+
+    async def fetch_translations(
+        self, lang: str, glossary_version: str, backend: str, source_hashes: list[str]
+    ) -> dict[str, str]:
+        keys = ((digest, lang, glossary_version, backend) for digest in source_hashes)
+        return {key[0]: self.translations[key] for key in keys if key in self.translations}
+
+    async def store_translations(
+        self,
+        lang: str,
+        glossary_version: str,
+        backend: str,
+        entries: list[tuple[str, str, str]],
+    ) -> None:
+        for digest, _, translated in entries:
+            self.translations.setdefault((digest, lang, glossary_version, backend), translated)
+
+    async def fetch_variant(self, variant_id: str) -> dict | None:
+        variant = self.variants.get(variant_id)
+        return dict(variant) if variant else None
+
+    async def fetch_job(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        variants = [v for v in self.variants.values() if v["job_id"] == job_id]
+        return {
+            **job,
+            "owner_id": self.projects[job["project_id"]]["owner_id"],
+            "variants": [dict(v) for v in sorted(variants, key=lambda v: v["lang"])],
+        }
+
+    async def fetch_queued_job_ids(self) -> list[str]:
+        return [job_id for job_id, job in self.jobs.items() if job["status"] == "queued"]
+
+    async def update_job_status(self, job_id: str, status: str, error: str | None = None) -> None:
+        job = self.jobs[job_id]
+        job.update(status=status, error_message=error)
+        if status in FINISHED_STATUSES:
+            self.finished_at.setdefault(job_id, time.perf_counter())
+
+    async def update_variant(self, variant_id: str, **fields: Any) -> None:
+        self.variants[variant_id].update(
+            {name: value for name, value in fields.items() if value is not None}
+        )
+
+    async def update_variant_by_job_and_lang(self, job_id: str, lang: str, **kwargs) -> dict | None:
+        for variant in self.variants.values():
+            if variant["job_id"] == job_id and variant["lang"] == lang:
+                await self.update_variant(variant["id"], **kwargs)
+                return {"id": variant["id"]}
+        return None
+
+    def seed_job(self, asset_id: str, langs: List[str], options: Dict[str, Any]) -> str:
+        asset = self.assets[asset_id]
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {
+            "id": job_id,
+            "project_id": asset["project_id"],
+            "source_asset_id": asset_id,
+            "voice_profile_id": None,
+            "options": options,
+            "status": "queued",
+            "error_message": None,
+        }
+        for lang in langs:
+            variant_id = str(uuid.uuid4())
+            self.variants[variant_id] = {
+                "id": variant_id,
+                "job_id": job_id,
+                "lang": lang,
+                "status": "queued",
+            }
+        return job_id
+
+
+class StageRecorder:
+    def __init__(self) -> None:
+        self.queue_wait: Dict[str, List[float]] = defaultdict(list)
+        self.processing: Dict[str, List[float]] = defaultdict(list)
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, queue_name: str, routing_key: str, waited: float, elapsed: float) -> None:
+        self.queue_wait[queue_name].append(waited)
+        self.processing[queue_name].append(elapsed)
+
+    def record_timings(self, routing_key: str, payload: Dict[str, Any]) -> None:
+        # Agents attach per-step wall times (e.g. ffmpeg passes) to their completion messages.
+        for name, seconds in (payload.get("timings") or {}).items():
+            self.timings[f"{payload.get('stage')}.{name}"].append(seconds)
+
+    def timings_report(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"count": len(samples), "total_s": round(sum(samples), 3), **summarize(samples)}
+            for name, samples in sorted(self.timings.items())
+        }
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        stages: Dict[str, Dict[str, Any]] = {}
+        for queue_name in sorted(self.processing):
+            waits = self.queue_wait[queue_name]
+            runs = self.processing[queue_name]
+            total_wait = sum(waits)
+            total = total_wait + sum(runs)
+            stages[queue_name] = {
+                "messages": len(runs),
+                "queue_wait": summarize(waits),
+                "processing": summarize(runs),
+                "total": summarize([wait + run for wait, run in zip(waits, runs)]),
+                "wait_share": round(total_wait / total, 4) if total else 0.0,
+            }
+        return stages
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    summary = {f"p{pct}_ms": round(percentile(samples, pct) * 1000, 3) for pct in PERCENTILES}
+    summary["mean_ms"] = round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0
+    summary["max_ms"] = round(max(samples, default=0.0) * 1000, 3)
+    return summary
+
+
+def generate_source(path: Path, duration: float, size: str) -> None:
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"color=c=#111111:s={size}:r=25:d={duration}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:duration={duration}",
+            "-vf",
+            "drawtext=text='BENCH SOURCE':fontcolor=white:fontsize=72:"
+            "x=(w-text_w)/2:y=(h-text_h)/2",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "22",
+            "-c:a",
+            "aac",
+            "-b:a",
+            "160k",
+            str(path),
+        ],
+        check=True,
+    )
+
+
+def load_single_node():
+    spec = importlib.util.spec_from_file_location("single_node", SINGLE_NODE)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"Cannot load {SINGLE_NODE}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["single_node"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def environment() -> Dict[str, Any]:
+    def output(command: List[str]) -> Optional[str]:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return result.stdout.splitlines()[0].strip() if result.stdout else None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": output(["git", "-C", str(REPO_ROOT), "rev-parse", "HEAD"]),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": output(["ffmpeg", "-version"]),
+    }
+
+
+async def run(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()]
+    # Same defaults as the product's JobOption: text in frame is opt-in.
+    options = {
+        "subs": not args.no_subs,
+        "dub": not args.no_dub,
+        "replace_text_in_frame": args.text_in_frame,
+        "fuse_text_in_frame": not args.separate_text_in_frame,
+        "upload_to_youtube": False,
+    }
+
+    database = MemoryDatabase()
+    storage = LocalStorage(root=workdir / "storage")
+    broker = glocal_service_kit.rabbitmq
+    if not isinstance(broker, LocalBroker):
+        raise RuntimeError("RUNTIME_MODE=local did not take effect")
+    recorder = StageRecorder()
+    broker.observer = recorder.record
+    publish = broker.publish
+
+    async def recording_publish(
+        routing_key: str, payload: Dict[str, Any], exchange: str = "jobs"
+    ) -> None:
+        recorder.record_timings(routing_key, payload)
+        await publish(routing_key, payload, exchange)
+
+    broker.publish = recording_publish  # type: ignore[method-assign]
+    # Services bind these names at import time, so swap them in before anything is loaded.
+    glocal_service_kit.database = database
+    glocal_service_kit.storage = storage
+
+    source_path = workdir / "source.mp4"
+    generate_source(source_path, args.duration, args.size)
+    project_id, asset_id = str(uuid.uuid4()), str(uuid.uuid4())
+    source_key = f"raw/{project_id}/{asset_id}/source.mp4"
+    await storage.upload_file(source_path, source_key, "video/mp4")
+    database.projects[project_id] = {"id": project_id, "owner_id": str(uuid.uuid4())}
+    database.assets[asset_id] = {
+        "id": asset_id,
+        "project_id": project_id,
+        "type": "video",
+        "s3_url": f"s3://{storage.bucket}/{source_key}",
+        "meta": {},
+    }
+    job_ids = [database.seed_job(asset_id, langs, options) for _ in range(args.jobs)]
+    # Only count traffic generated by the pipeline itself.
+    storage.stats = dict.fromkeys(storage.stats, 0)
+
+    single_node = load_single_node()
+    tasks = await single_node.start_services(single_node.SERVICES)
+    try:
+        # Ingest happens at upload time, before any job exists, so it is not part of the timing.
+        await broker.publish("asset.uploaded", {"asset_id": asset_id, "key": source_key})
+        await broker.join()
+        started = time.perf_counter()
+        submitted = {}
+        for job_id in job_ids:
+            submitted[job_id] = time.perf_counter()
+            await single_node.submit_job(job_id)
+        await broker.join()
+        wall = time.perf_counter() - started
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    statuses = Counter(database.jobs[job_id]["status"] for job_id in job_ids)
+    latencies = [
+        database.finished_at[job_id] - submitted[job_id]
+        for job_id in job_ids
+        if job_id in database.finished_at
+    ]
+    return {
+        "benchmark": "pipeline",
+        "environment": environment(),
+        "config": {
+            "jobs": args.jobs,
+            "langs": langs,
+            "source_duration_s": args.duration,
+            "source_size": args.size,
+            "options": options,
+        },
+        "wall_seconds": round(wall, 3),
+        "jobs_per_minute": round(len(latencies) / wall * 60, 3) if wall else 0.0,
+        "job_status": dict(statuses),
+        "job_latency": summarize(latencies),
+        "stages": recorder.report(),
+        "step_timings": recorder.timings_report(),
+        "storage": storage.stats,
+        "cpu_executor": glocal_service_kit.cpu_executor.stats(),
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(
+        f"{results['config']['jobs']} jobs x {len(results['config']['langs'])} langs in "
+        f"{results['wall_seconds']:.1f}s -> {results['jobs_per_minute']:.2f} jobs/min "
+        f"{results['job_status']}"
+    )
+    header = f"{'queue':<22}{'msgs':>6}"
+    for column in ("wait", "proc"):
+        header += "".join(f"{f'{column} p{pct}':>12}" for pct in PERCENTILES)
+    print(header + f"{'wait %':>8}")
+    for queue_name, row in results["stages"].items():
+        line = f"{queue_name:<22}{row['messages']:>6}"
+        for column in ("queue_wait", "processing"):
+            line += "".join(f"{row[column][f'p{pct}_ms']:>12.1f}" for pct in PERCENTILES)
+        print(line + f"{row['wait_share'] * 100:>8.1f}")
+    for name, row in results["step_timings"].items():
+        print(
+            f"{name:<28}{row['count']:>6}  total {row['total_s']:>8.2f}s  "
+            f"p50 {row['p50_ms']:>9.1f}ms"
+        )
+    storage = results["storage"]
+    print(
+        f"storage: {storage['uploads']} uploads / {storage['bytes_uploaded']} bytes, "
+        f"{storage['downloads']} downloads / {storage['bytes_downloaded']} bytes, "
+        f"{storage['streamed']} read in place"
+    )
+    executor = results["cpu_executor"]
+    for name, row in executor["tasks"].items():
+        print(
+            f"cpu {name:<24}{row['count']:>6}  mean {row['mean_s'] * 1000:>8.1f}ms  "
+            f"wait {row['mean_wait_s'] * 1000:>8.1f}ms  (workers {executor['workers']}, "
+            f"max queue {executor['max_queue_depth']})"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--langs", default="es,pt-BR", help="comma separated target languages")
+    parser.add_argument("--duration", type=float, default=8.0, help="source video seconds")
+    parser.add_argument("--size", default="1280x720", help="source video resolution")
+    parser.add_argument("--no-subs", action="store_true")
+    parser.add_argument("--no-dub", action="store_true")
+    parser.add_argument(
+        "--text-in-frame", action="store_true", help="enable replace_text_in_frame on every job"
+    )
+    parser.add_argument(
+        "--separate-text-in-frame",
+        action="store_true",
+        help="with --text-in-frame, run the overlay as its own textinframe stage instead of mix",
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="glocal-bench-"))
+    try:
+        results = asyncio.run(run(args, workdir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
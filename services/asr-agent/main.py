@@ -4,12 +4,18 @@ import asyncio
 import json
 import math
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
+from glocal_service_kit import (
+    database,
+    job_key,
+    media_duration,
+    publish_job_event,
+    rabbitmq,
+    storage,
+)
 
 SEGMENT_TEXT = [
     "Welcome to Glocal Ads AI demo.",
@@ -18,27 +24,9 @@ SEGMENT_TEXT = [
 ]
 
 
-async def probe_duration(path: Path) -> float:
-    result = await asyncio.to_thread(
-        subprocess.run,
-        [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            str(path),
-        ],
-        capture_output=True,
-        text=True,
-        check=True,
-    )
-    try:
-        return float(result.stdout.strip())
-    except ValueError:
-        return 8.0
+async def probe_duration(source: str) -> float:
+    duration = await media_duration(source)
+    return 8.0 if duration is None else duration
 
 
 def build_segments(duration: float) -> List[Dict[str, Any]]:
@@ -80,51 +68,64 @@ def format_ts(value: float) -> str:
     return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d},{milliseconds:03d}"
 
 
+async def publish_progress(job_id: str, langs: List[str], **kwargs: Any) -> None:
+    for lang in langs:
+        await publish_job_event(job_id, "asr", lang=lang, **kwargs)
+
+
 async def handle_message(message: Dict[str, Any]) -> None:
     job_id = message["job_id"]
-    variant_id = message["variant_id"]
-    lang = message["lang"]
+    langs: List[str] = message.get("langs", [])
     source_key = message["source"]["key"]
     base_prefix = message["base_prefix"]
     await database.connect()
-    await publish_job_event(job_id, "asr", "processing", lang, progress=0.2)
+    await publish_progress(job_id, langs, status="processing", progress=0.2)
     temp_dir = Path(tempfile.mkdtemp(prefix="asr-"))
     try:
-        source_path = temp_dir / "source.mp4"
-        await storage.download_file(source_key, source_path)
-        duration = await probe_duration(source_path)
+        # The mono 16 kHz analysis track from ingest is what a speech model takes, so timing
+        # comes from the track itself; assets that predate it fall back to the ingest probe,
+        # and only then to demuxing the full source container.
+        audio_key = message["source"].get("analysis_audio_key")
+        duration = (message["source"].get("probe") or {}).get("duration")
+        if audio_key:
+            audio_input = "analysis"
+            asr_input = await storage.media_input(audio_key, temp_dir / "analysis.flac")
+            duration = await probe_duration(asr_input)
+        elif duration is not None:
+            audio_input = "probe"
+        else:
+            audio_input = "source"
+            asr_input = await storage.media_input(source_key, temp_dir / "source.mp4")
+            duration = await probe_duration(asr_input)
         segments = build_segments(duration)
         segments_json = json.dumps(segments, indent=2)
         await storage.upload_bytes(
             segments_json.encode("utf-8"),
-            job_stage_key(job_id, lang, "asr", "segments.json"),
+            job_key(job_id, "asr", "segments.json"),
             "application/json",
         )
         await storage.upload_bytes(
             segments_to_srt(segments).encode("utf-8"),
-            job_stage_key(job_id, lang, "asr", "transcript.srt"),
+            job_key(job_id, "asr", "transcript.srt"),
             "application/x-subrip",
         )
-        await publish_job_event(job_id, "asr", "processing", lang, progress=0.8)
+        await publish_progress(job_id, langs, status="processing", progress=0.8)
         await rabbitmq.publish(
             "stage.asr.completed",
             {
                 "job_id": job_id,
-                "variant_id": variant_id,
-                "lang": lang,
                 "stage": "asr",
                 "status": "completed",
                 "base_prefix": base_prefix,
+                "audio_input": audio_input,
             },
         )
     except Exception as exc:  # pragma: no cover - runtime failure path
-        await publish_job_event(job_id, "asr", "error", lang, message=str(exc))
+        await publish_progress(job_id, langs, status="error", message=str(exc))
         await rabbitmq.publish(
             "stage.asr.failed",
             {
                 "job_id": job_id,
-                "variant_id": variant_id,
-                "lang": lang,
                 "stage": "asr",
                 "status": "error",
                 "error": str(exc),
@@ -134,9 +135,11 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("asr-agent", "stage.asr")
+    if ready is not None:
+        ready.set()
     await rabbitmq.consume("asr-agent", handle_message)
 
 
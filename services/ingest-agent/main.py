@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from glocal_service_kit import (
+    analysis_key,
+    database,
+    ffmpeg_input,
+    probe_source,
+    rabbitmq,
+    run_ffmpeg,
+    storage,
+)
+
+logger = logging.getLogger(__name__)
+
+IO_CONCURRENCY = 4
+ANALYSIS_SAMPLE_RATE = 16000
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def extract_analysis_audio(source_input: str, temp_dir: Path) -> Dict[str, Any]:
+    track_path = temp_dir / "analysis.flac"
+    extract = await run_ffmpeg(
+        [
+            "ffmpeg",
+            "-y",
+            *ffmpeg_input(source_input),
+            "-map",
+            "0:a:0",
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(ANALYSIS_SAMPLE_RATE),
+            "-sample_fmt",
+            "s16",
+            "-c:a",
+            "flac",
+            # Bit-exact output without tags, so the same audio always hashes to the same key.
+            "-map_metadata",
+            "-1",
+            "-fflags",
+            "+bitexact",
+            "-flags:a",
+            "+bitexact",
+            str(track_path),
+        ]
+    )
+    digest = await asyncio.to_thread(file_digest, track_path)
+    key = analysis_key(digest, ".flac")
+    if not await storage.object_exists(key):
+        await storage.upload_file(track_path, key, "audio/flac")
+    return {
+        "key": key,
+        "sha256": digest,
+        "codec": "flac",
+        "sample_rate": ANALYSIS_SAMPLE_RATE,
+        "channels": 1,
+        "bytes": track_path.stat().st_size,
+        "extract_s": extract.seconds,
+        "extract_speed": extract.speed,
+    }
+
+
+async def handle_message(message: Dict[str, Any]) -> None:
+    asset_id = message["asset_id"]
+    source_key = message["key"]
+    await database.connect()
+    temp_dir = Path(tempfile.mkdtemp(prefix="ingest-"))
+    try:
+        source_input = await storage.media_input(source_key, temp_dir / "source")
+        probe = await probe_source(source_input)
+        probe["probed_at"] = datetime.now(timezone.utc).isoformat()
+        await database.update_asset_meta(asset_id, {"probe": probe})
+        if probe["audio"] is not None:
+            analysis_audio = await extract_analysis_audio(source_input, temp_dir)
+            await database.update_asset_meta(asset_id, {"analysis_audio": analysis_audio})
+    except Exception as exc:  # pragma: no cover - runtime failure path
+        # Workers fall back to the source itself for anything ingest did not store.
+        logger.exception("ingest failed for asset=%s", asset_id)
+        await database.update_asset_meta(asset_id, {"ingest_error": str(exc)})
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+async def main(ready: Optional[asyncio.Event] = None) -> None:
+    await database.connect()
+    await rabbitmq.declare_queue("ingest-agent", "asset.uploaded")
+    if ready is not None:
+        ready.set()
+    await rabbitmq.consume("ingest-agent", handle_message, concurrency=IO_CONCURRENCY)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,120 +2,217 @@ from __future__ import annotations
 
 import asyncio
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
+from glocal_service_kit import (
+    HLS_CONTENT_TYPES,
+    HLS_MANIFEST,
+    HLS_SEGMENT_SECONDS,
+    database,
+    ffmpeg_input,
+    job_key,
+    job_stage_key,
+    keyframe_args,
+    localized_text,
+    media_duration,
+    probe_source,
+    publish_job_event,
+    rabbitmq,
+    run_ffmpeg,
+    storage,
+    text_overlay_filter,
+    trim_args,
+    write_mp4_and_hls,
+)
 
 
-async def run_ffmpeg(command: list[str]) -> None:
-    await asyncio.to_thread(
-        subprocess.run,
-        command,
-        check=True,
+def can_copy_video(stream: Dict[str, Any]) -> bool:
+    # HLS can only cut at keyframes, so a copied picture must have one at least every segment.
+    # That takes the longest gap, not the typical one; an unknown cadence (a single keyframe
+    # in the probe window) re-encodes.
+    interval = stream.get("max_keyframe_interval")
+    return (
+        stream.get("codec_name") == "h264"
+        and stream.get("pix_fmt") == "yuv420p"
+        and interval is not None
+        and interval <= HLS_SEGMENT_SECONDS
     )
 
 
+async def publish_progress(job_id: str, langs: List[str], **kwargs: Any) -> None:
+    for lang in langs:
+        await publish_job_event(job_id, "video", lang=lang, **kwargs)
+
+
+async def handle_video(message: Dict[str, Any]) -> None:
+    job_id = message["job_id"]
+    langs: List[str] = message.get("langs", [])
+    base_prefix = message["base_prefix"]
+    await database.connect()
+    await publish_progress(job_id, langs, status="processing", progress=0.1)
+    temp_dir = Path(tempfile.mkdtemp(prefix="mix-video-"))
+    try:
+        source_input = await storage.media_input(message["source"]["key"], temp_dir / "source.mp4")
+        video_stream = (message["source"].get("probe") or {}).get("video")
+        if video_stream is None or "max_keyframe_interval" not in video_stream:
+            # No ingest probe, or one from before the longest keyframe gap was recorded.
+            video_stream = (await probe_source(source_input))["video"] or {}
+        copy_video = can_copy_video(video_stream)
+        if copy_video:
+            video_args = ["-c:v", "copy"]
+        else:
+            video_args = [
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "21",
+                "-pix_fmt",
+                "yuv420p",
+                *keyframe_args(),
+            ]
+        video_path = temp_dir / "video.mp4"
+
+        async def report_progress(fraction: float) -> None:
+            await publish_progress(
+                job_id, langs, status="processing", progress=0.1 + 0.8 * fraction
+            )
+
+        video = await run_ffmpeg(
+            [
+                "ffmpeg",
+                "-y",
+                *ffmpeg_input(source_input),
+                "-map",
+                "0:v:0",
+                *video_args,
+                "-an",
+                "-movflags",
+                "+faststart",
+                str(video_path),
+            ],
+            duration=(message["source"].get("probe") or {}).get("duration"),
+            on_progress=report_progress,
+        )
+        video_key = job_key(job_id, "video", "video.mp4")
+        await storage.upload_file(video_path, video_key, "video/mp4")
+        await publish_progress(job_id, langs, status="processing", progress=0.9)
+        await rabbitmq.publish(
+            "stage.video.completed",
+            {
+                "job_id": job_id,
+                "stage": "video",
+                "status": "completed",
+                "base_prefix": base_prefix,
+                "video_key": video_key,
+                "video_mode": "copy" if copy_video else "encode",
+                "ffmpeg": video.as_dict(),
+                "timings": {"video_s": video.seconds},
+            },
+        )
+    except Exception as exc:  # pragma: no cover
+        await publish_progress(job_id, langs, status="error", message=str(exc))
+        await rabbitmq.publish(
+            "stage.video.failed",
+            {
+                "job_id": job_id,
+                "stage": "video",
+                "status": "error",
+                "error": str(exc),
+            },
+        )
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 async def handle_message(message: Dict[str, Any]) -> None:
     job_id = message["job_id"]
     variant_id = message["variant_id"]
     lang = message["lang"]
     base_prefix = message["base_prefix"]
     expect_tts = message.get("expect_tts", True)
+    burn_text = message.get("burn_text_in_frame", False)
     await database.connect()
     await publish_job_event(job_id, "mix", "processing", lang, progress=0.1)
     temp_dir = Path(tempfile.mkdtemp(prefix="mix-"))
     try:
+        source_key = message["source"]["key"]
         source_path = temp_dir / "source.mp4"
-        await storage.download_file(message["source"]["key"], source_path)
-        tts_key = job_stage_key(job_id, lang, "tts", "track.wav")
-        tts_path = temp_dir / "track.wav"
-        has_tts = expect_tts
-        if expect_tts:
-            await storage.download_file(tts_key, tts_path)
+        if burn_text:
+            # The overlay needs an encode anyway, so start from the source picture.
+            video_input = await storage.media_input(source_key, source_path)
+            video_args = [
+                "-vf",
+                text_overlay_filter(localized_text(lang)),
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "21",
+                "-pix_fmt",
+                "yuv420p",
+                *keyframe_args(),
+            ]
         else:
-            has_tts = False
-        output_mp4 = temp_dir / "out.mp4"
-        if has_tts and tts_path.exists():
-            await run_ffmpeg(
-                [
-                    "ffmpeg",
-                    "-y",
-                    "-i",
-                    str(source_path),
-                    "-i",
-                    str(tts_path),
-                    "-map",
-                    "0:v",
-                    "-map",
-                    "1:a",
-                    "-c:v",
-                    "libx264",
-                    "-preset",
-                    "veryfast",
-                    "-crf",
-                    "21",
-                    "-c:a",
-                    "aac",
-                    "-b:a",
-                    "192k",
-                    "-shortest",
-                    str(output_mp4),
-                ]
+            # The job-level video stage produced the shared picture; only audio is per language.
+            video_input = await storage.media_input(
+                job_key(job_id, "video", "video.mp4"), temp_dir / "video.mp4"
             )
+            video_args = ["-c:v", "copy"]
+        if expect_tts:
+            tts_key = job_stage_key(job_id, lang, "tts", "track.wav")
+            audio_input = await storage.media_input(tts_key, temp_dir / "track.wav")
+        elif burn_text:
+            audio_input = video_input
         else:
-            await run_ffmpeg(
-                [
-                    "ffmpeg",
-                    "-y",
-                    "-i",
-                    str(source_path),
-                    "-c:v",
-                    "libx264",
-                    "-preset",
-                    "veryfast",
-                    "-c:a",
-                    "aac",
-                    "-b:a",
-                    "192k",
-                    str(output_mp4),
-                ]
-            )
+            audio_input = await storage.media_input(source_key, source_path)
+        output_mp4 = temp_dir / "out.mp4"
         hls_dir = temp_dir / "hls"
         hls_dir.mkdir(exist_ok=True)
-        await run_ffmpeg(
+        duration = (message["source"].get("probe") or {}).get("duration")
+        if duration is None:
+            duration = await media_duration(video_input)
+
+        async def report_progress(fraction: float) -> None:
+            await publish_job_event(
+                job_id, "mix", "processing", lang, progress=0.1 + 0.8 * fraction
+            )
+
+        encode = await write_mp4_and_hls(
             [
                 "ffmpeg",
                 "-y",
-                "-i",
-                str(output_mp4),
-                "-codec:v",
-                "libx264",
-                "-codec:a",
+                *ffmpeg_input(video_input),
+                *ffmpeg_input(audio_input),
+                "-map",
+                "0:v",
+                "-map",
+                "1:a?",
+                *video_args,
+                "-c:a",
                 "aac",
-                "-start_number",
-                "0",
-                "-hls_time",
-                "2",
-                "-hls_list_size",
-                "0",
-                "-hls_segment_filename",
-                str(hls_dir / "segment_%03d.ts"),
-                str(hls_dir / "index.m3u8"),
-            ]
+                "-b:a",
+                "192k",
+                *trim_args(duration, pad_audio=expect_tts),
+            ],
+            output_mp4,
+            hls_dir,
+            duration=duration,
+            on_progress=report_progress,
         )
         video_key = job_stage_key(job_id, lang, "mix", "out.mp4")
-        preview_key = job_stage_key(job_id, lang, "mix", "hls", "index.m3u8")
+        preview_key = job_stage_key(job_id, lang, "mix", "hls", HLS_MANIFEST)
         await storage.upload_file(output_mp4, video_key, "video/mp4")
-        for segment in hls_dir.glob("*"):
-            content_type = "application/x-mpegURL" if segment.suffix == ".m3u8" else "video/mp2t"
-            await storage.upload_file(
-                segment,
-                job_stage_key(job_id, lang, "mix", "hls", segment.name),
-                content_type,
-            )
+        hls_upload = await storage.upload_directory(
+            hls_dir,
+            job_stage_key(job_id, lang, "mix", "hls"),
+            HLS_CONTENT_TYPES,
+            manifest=HLS_MANIFEST,
+        )
         await database.update_variant(
             variant_id,
             video_url=f"s3://{storage.bucket}/{video_key}",
@@ -133,6 +230,13 @@ async def handle_message(message: Dict[str, Any]) -> None:
                 "base_prefix": base_prefix,
                 "video_key": video_key,
                 "preview_key": preview_key,
+                "text_in_frame": burn_text,
+                "hls_upload": hls_upload.as_dict(),
+                "ffmpeg": encode.as_dict(),
+                "timings": {
+                    "encode_s" if burn_text else "mux_s": encode.seconds,
+                    "hls_upload_s": round(hls_upload.seconds, 3),
+                },
             },
         )
     except Exception as exc:  # pragma: no cover
@@ -152,10 +256,16 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("mix-agent", "stage.mix")
-    await rabbitmq.consume("mix-agent", handle_message)
+    await rabbitmq.declare_queue("mix-agent.video", "stage.video")
+    if ready is not None:
+        ready.set()
+    await asyncio.gather(
+        rabbitmq.consume("mix-agent", handle_message),
+        rabbitmq.consume("mix-agent.video", handle_video),
+    )
 
 
 if __name__ == "__main__":
@@ -1,26 +1,97 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from glocal_service_kit import (
     database,
+    job_key,
+    job_stage_key,
     parse_s3_url,
     publish_job_event,
     rabbitmq,
+    storage,
 )
 
-PIPELINE: List[str] = [
-    "asr",
-    "translate",
-    "tts",
-    "mix",
-    "subs",
-    "textinframe",
-    "qc",
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    name: str
+    needs: Tuple[str, ...] = ()
+    scope: str = "variant"
+    # Object the stage writes; finding it in storage proves the stage ran when progress has
+    # to be rebuilt. Shared outputs live under the job prefix, the rest under each language.
+    output: Tuple[str, ...] = ()
+    shared_output: bool = False
+
+
+# Declared in topological order: every stage only needs stages listed above it.
+# Job-scoped stages run once per job and their output is shared by every language.
+PIPELINE: List[StageSpec] = [
+    StageSpec("asr", scope="job", output=("asr", "segments.json"), shared_output=True),
+    StageSpec("video", scope="job", output=("video", "video.mp4"), shared_output=True),
+    # All languages are translated in one message so the backend gets large batches.
+    StageSpec("translate", needs=("asr",), scope="job", output=("translate", "segments.json")),
+    StageSpec("tts", needs=("translate",), output=("tts", "track.wav")),
+    StageSpec("mix", needs=("tts", "video"), output=("mix", "out.mp4")),
+    StageSpec("subs", needs=("translate",), output=("subs", "subtitles.vtt")),
+    StageSpec("textinframe", needs=("mix",), output=("textinframe", "out.mp4")),
+    StageSpec("qc", needs=("tts", "mix", "subs", "textinframe"), output=("qc", "report.json")),
 ]
 
+STAGES: Dict[str, StageSpec] = {spec.name: spec for spec in PIPELINE}
+
+StageMessage = Tuple[str, Dict[str, Any]]
+# A stage event as (variant_id, stage); job-scoped stages report without a variant.
+StageRef = Tuple[Optional[str], str]
+
+
+def stage_ancestors(stage: str) -> Set[str]:
+    ancestors: Set[str] = set()
+    pending = list(STAGES[stage].needs)
+    while pending:
+        name = pending.pop()
+        if name not in ancestors:
+            ancestors.add(name)
+            pending.extend(STAGES[name].needs)
+    return ancestors
+
+
+def stage_output_key(spec: StageSpec, job_id: str, lang: str) -> str:
+    if spec.shared_output:
+        return job_key(job_id, *spec.output)
+    return job_stage_key(job_id, lang, *spec.output)
+
+
+def fuses_text_in_frame(options: Dict[str, Any]) -> bool:
+    # Fused mode burns the overlay in during mix, so the textinframe pass and the shared
+    # job-level video (which mix would only decode again) are skipped.
+    return bool(
+        options.get("replace_text_in_frame", False) and options.get("fuse_text_in_frame", True)
+    )
+
+
+def source_descriptor(asset: Dict[str, Any]) -> Dict[str, Any]:
+    _, source_key = parse_s3_url(asset["s3_url"])
+    meta = asset.get("meta") or {}
+    # Ingest results ride along in every stage payload so workers need not re-read the source.
+    return {
+        "key": source_key,
+        "type": asset["type"],
+        "probe": meta.get("probe"),
+        "analysis_audio_key": (meta.get("analysis_audio") or {}).get("key"),
+    }
+
+
+CONTEXT_CACHE_SIZE = 512
+FAILED_CACHE_SIZE = 1024
+EVENT_CONCURRENCY = 8
+
 
 @dataclass
 class JobContext:
@@ -29,20 +100,85 @@ class JobContext:
     source_asset: Dict[str, Any]
     options: Dict[str, Any]
     voice_profile: Optional[Dict[str, Any]]
+    variants: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class VariantProgress:
+    done: Set[str] = field(default_factory=set)
+    dispatched: Set[str] = field(default_factory=set)
+
+    def in_flight(self, variant_id: str) -> Set[StageRef]:
+        return {
+            (None if STAGES[stage].scope == "job" else variant_id, stage)
+            for stage in self.dispatched - self.done
+        }
+
+
+@dataclass
+class FailedRun:
+    job_id: str
+    # Stages still running when the failure was handled; their events are dropped as they
+    # arrive. None when progress was already lost and what is outstanding is unknown.
+    pending: Optional[Set[StageRef]]
+
+
+class JobContextCache:
+    def __init__(self, max_size: int = CONTEXT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, JobContext] = OrderedDict()
+
+    def get(self, job_id: str) -> Optional[JobContext]:
+        context = self._entries.get(job_id)
+        if context is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(job_id)
+        return context
+
+    def put(self, context: JobContext) -> None:
+        self._entries[context.job_id] = context
+        self._entries.move_to_end(context.job_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, job_id: str) -> None:
+        self._entries.pop(job_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
 
 
 class Orchestrator:
     def __init__(self) -> None:
         self._lock = asyncio.Lock()
+        self.contexts = JobContextCache()
+        self._progress: Dict[str, VariantProgress] = {}
+        self._job_stages: Dict[str, Set[str]] = {}
+        # Failed variant and job ids. Late events for them must not look like lost state,
+        # or recover_progress would restart the failed work.
+        self._failed: OrderedDict[str, FailedRun] = OrderedDict()
 
-    async def start(self) -> None:
+    async def start(self, ready: Optional[asyncio.Event] = None) -> None:
         await database.connect()
         await rabbitmq.declare_queue("orchestrator.jobs", "job.created")
         await rabbitmq.declare_queue("orchestrator.events", "stage.*.completed")
         await rabbitmq.declare_queue("orchestrator.events", "stage.*.failed")
+        if ready is not None:
+            ready.set()
         consumers = [
             asyncio.create_task(rabbitmq.consume("orchestrator.jobs", self.handle_job_created)),
-            asyncio.create_task(rabbitmq.consume("orchestrator.events", self.handle_stage_event)),
+            asyncio.create_task(
+                rabbitmq.consume(
+                    "orchestrator.events",
+                    self.handle_stage_event,
+                    concurrency=EVENT_CONCURRENCY,
+                    order_key="job_id",
+                )
+            ),
         ]
         await asyncio.gather(*consumers)
 
@@ -56,21 +192,23 @@ class Orchestrator:
         if asset is None:
             await database.update_job_status(job_id, "error", error="Source asset missing")
             return
-        _, source_key = parse_s3_url(asset["s3_url"])
         voice_profile = None
         if job.get("voice_profile_id"):
             voice_profile = await database.fetch_voice_profile(job["voice_profile_id"])
         context = JobContext(
             job_id=job_id,
             project_id=job["project_id"],
-            source_asset={"key": source_key, "type": asset["type"]},
+            source_asset=source_descriptor(asset),
             options=job.get("options") or {},
             voice_profile=voice_profile,
+            variants={variant["id"]: variant["lang"] for variant in job["variants"]},
         )
+        self.contexts.put(context)
+        messages: List[StageMessage] = []
         for variant in job["variants"]:
             await database.update_variant(variant["id"], status="processing")
-            await publish_job_event(job_id, "asr", "queued", variant["lang"])
-            await self.enqueue_stage("asr", context, variant)
+            messages.extend(await self.advance(context, variant["id"], variant["lang"]))
+        await rabbitmq.publish_batch(messages)
 
     async def handle_stage_event(self, message: Dict[str, Any]) -> None:
         job_id = message.get("job_id")
@@ -78,27 +216,210 @@ class Orchestrator:
         lang = message.get("lang")
         stage = message.get("stage")
         status = message.get("status")
-        if not (job_id and variant_id and lang and stage and status):
+        if not (job_id and stage and status):
+            return
+        if stage in STAGES and STAGES[stage].scope == "job":
+            await self.handle_job_stage_event(job_id, stage, status, message)
+            return
+        if not (variant_id and lang):
+            return
+        if self.drop_failed_event(job_id, variant_id, stage, status):
             return
         if status == "error":
             error_message = message.get("error", "Stage failed")
+            await self.mark_failed(variant_id, job_id, [variant_id], failed=(variant_id, stage))
             await database.update_variant(variant_id, status="error", error_message=error_message)
             await publish_job_event(job_id, stage, "error", lang, message=error_message)
             await database.update_job_status(job_id, "error", error=error_message)
             return
+        if stage not in STAGES:
+            return
         await publish_job_event(job_id, stage, "done", lang, progress=1.0)
-        next_stage = await self.get_next_stage(job_id, stage, lang)
-        if next_stage is None:
+        context = await self.get_context(job_id)
+        await rabbitmq.publish_batch(await self.advance(context, variant_id, lang, completed=stage))
+
+    async def handle_job_stage_event(
+        self,
+        job_id: str,
+        stage: str,
+        status: str,
+        message: Dict[str, Any],
+    ) -> None:
+        if self.drop_failed_event(job_id, None, stage, status):
+            return
+        context = await self.get_context(job_id)
+        if status == "error":
+            error_message = message.get("error", "Stage failed")
+            await self.mark_failed(job_id, job_id, list(context.variants), failed=(None, stage))
+            for variant_id, lang in context.variants.items():
+                await database.update_variant(
+                    variant_id, status="error", error_message=error_message
+                )
+                await publish_job_event(job_id, stage, "error", lang, message=error_message)
+            await database.update_job_status(job_id, "error", error=error_message)
+            return
+        messages: List[StageMessage] = []
+        for variant_id, lang in context.variants.items():
+            # A failed variant still waits for this job stage; count it as drained instead.
+            if self.drop_failed_event(job_id, variant_id, stage, status, scope="job"):
+                continue
+            await publish_job_event(job_id, stage, "done", lang, progress=1.0)
+            messages.extend(await self.advance(context, variant_id, lang, completed=stage))
+        await rabbitmq.publish_batch(messages)
+
+    async def mark_failed(
+        self,
+        failed_id: str,
+        job_id: str,
+        variant_ids: List[str],
+        failed: StageRef,
+    ) -> None:
+        async with self._lock:
+            pending: Optional[Set[StageRef]] = set()
+            for variant_id in variant_ids:
+                progress = self._progress.pop(variant_id, None)
+                earlier = self._failed.pop(variant_id, None) if variant_id != failed_id else None
+                if earlier is not None:
+                    # The variant failed before the job did; its outstanding events move over.
+                    if earlier.pending is None:
+                        pending = None
+                    elif pending is not None:
+                        pending |= earlier.pending
+                elif progress is None:
+                    pending = None
+                elif pending is not None:
+                    pending |= progress.in_flight(variant_id)
+            if pending is not None:
+                pending.discard(failed)
+            self._failed[failed_id] = FailedRun(job_id=job_id, pending=pending)
+            self._failed.move_to_end(failed_id)
+            while len(self._failed) > FAILED_CACHE_SIZE:
+                self._failed.popitem(last=False)
+            if not pending:
+                self.release_failed(self._failed[failed_id])
+
+    def drop_failed_event(
+        self,
+        job_id: str,
+        variant_id: Optional[str],
+        stage: str,
+        status: str,
+        scope: str = "variant",
+    ) -> bool:
+        failed_id = job_id if job_id in self._failed else variant_id
+        run = self._failed.get(failed_id) if failed_id else None
+        if run is None:
+            return False
+        logger.info("Dropping %s event for stage %s of failed %s", status, stage, failed_id)
+        if run.pending:
+            run.pending.discard((variant_id if scope == "variant" else None, stage))
+            if not run.pending:
+                self.release_failed(run)
+        return True
+
+    def release_failed(self, run: FailedRun) -> None:
+        # Every in-flight event was dropped. Free the job's state unless other variants of it
+        # are still running; the id itself stays in the bounded set to catch redeliveries.
+        context = self.contexts.get(run.job_id)
+        if context is not None and any(vid in self._progress for vid in context.variants):
+            return
+        self.contexts.evict(run.job_id)
+        self._job_stages.pop(run.job_id, None)
+
+    async def advance(
+        self,
+        context: JobContext,
+        variant_id: str,
+        lang: str,
+        completed: Optional[str] = None,
+    ) -> List[StageMessage]:
+        recovered: Optional[VariantProgress] = None
+        if completed is not None and variant_id not in self._progress:
+            recovered = await self.recover_progress(context, lang, completed)
+        async with self._lock:
+            progress = self._progress.get(variant_id)
+            if progress is None:
+                progress = recovered or VariantProgress()
+                self._progress[variant_id] = progress
+                # Job-scoped stages that already ran or are in flight must not be sent again
+                # by any of the job's variants.
+                self._job_stages.setdefault(context.job_id, set()).update(
+                    stage for stage in progress.dispatched if STAGES[stage].scope == "job"
+                )
+            if completed is not None:
+                progress.done.add(completed)
+            ready, skipped = self.plan_stages(progress, context.options)
+            finished = len(progress.done) == len(PIPELINE)
+            if finished:
+                self._progress.pop(variant_id, None)
+        for stage in skipped:
+            await publish_job_event(context.job_id, stage, "skipped", lang, progress=1.0)
+        if finished:
             await database.update_variant(variant_id, status="done")
-            await publish_job_event(job_id, "pack", "done", lang, progress=1.0)
-            await self.check_job_completion(job_id)
-        else:
-            await publish_job_event(job_id, next_stage, "queued", lang)
-            await self.enqueue_stage(
-                next_stage,
-                await self.build_context(job_id),
-                await database.fetch_variant(variant_id),
-            )
+            await publish_job_event(context.job_id, "pack", "done", lang, progress=1.0)
+            await self.check_job_completion(context.job_id)
+            return []
+        messages: List[StageMessage] = []
+        for stage in ready:
+            await publish_job_event(context.job_id, stage, "queued", lang)
+            if STAGES[stage].scope == "job":
+                job_message = await self.job_stage_message(stage, context)
+                if job_message is not None:
+                    messages.append(job_message)
+            else:
+                messages.append(self.stage_message(stage, context, variant_id, lang))
+        return messages
+
+    async def recover_progress(
+        self,
+        context: JobContext,
+        lang: str,
+        completed: str,
+    ) -> VariantProgress:
+        # Lost state (e.g. orchestrator restart): everything upstream of the completed stage
+        # is done, and so is every stage whose output is already stored.
+        done = stage_ancestors(completed)
+        for spec in PIPELINE:
+            if spec.name in done or spec.name == completed or not spec.output:
+                continue
+            if await storage.object_exists(stage_output_key(spec, context.job_id, lang)):
+                done.add(spec.name)
+        # A stage is dispatched the moment its needs are done, so anything that was runnable
+        # before this event is in flight already; skippable stages are left to plan_stages.
+        dispatched = set(done) | {
+            spec.name
+            for spec in PIPELINE
+            if all(need in done for need in spec.needs)
+            and not self.should_skip(spec.name, context.options)
+        }
+        return VariantProgress(done=done, dispatched=dispatched)
+
+    def plan_stages(
+        self,
+        progress: VariantProgress,
+        options: Dict[str, Any],
+    ) -> Tuple[List[str], List[str]]:
+        ready: List[str] = []
+        skipped: List[str] = []
+        for spec in PIPELINE:
+            if spec.name in progress.done or spec.name in progress.dispatched:
+                continue
+            if not all(need in progress.done for need in spec.needs):
+                continue
+            if self.should_skip(spec.name, options):
+                progress.done.add(spec.name)
+                skipped.append(spec.name)
+            else:
+                progress.dispatched.add(spec.name)
+                ready.append(spec.name)
+        return ready, skipped
+
+    async def get_context(self, job_id: str) -> JobContext:
+        context = self.contexts.get(job_id)
+        if context is None:
+            context = await self.build_context(job_id)
+            self.contexts.put(context)
+        return context
 
     async def build_context(self, job_id: str) -> JobContext:
         job = await database.fetch_job(job_id)
@@ -107,60 +428,66 @@ class Orchestrator:
         asset = await database.fetch_asset(job["source_asset_id"])
         if asset is None:
             raise RuntimeError("Missing asset for job")
-        _, source_key = parse_s3_url(asset["s3_url"])
         voice_profile = None
         if job.get("voice_profile_id"):
             voice_profile = await database.fetch_voice_profile(job["voice_profile_id"])
         return JobContext(
             job_id=job_id,
             project_id=job["project_id"],
-            source_asset={"key": source_key, "type": asset["type"]},
+            source_asset=source_descriptor(asset),
             options=job.get("options") or {},
             voice_profile=voice_profile,
+            variants={variant["id"]: variant["lang"] for variant in job["variants"]},
         )
 
-    async def enqueue_stage(
+    def stage_message(
         self,
         stage: str,
         context: JobContext,
-        variant: Dict[str, Any] | None,
-    ) -> None:
-        if variant is None:
-            return
+        variant_id: str,
+        lang: str,
+    ) -> StageMessage:
         payload = {
             "job_id": context.job_id,
             "project_id": context.project_id,
-            "variant_id": variant["id"],
-            "lang": variant["lang"],
+            "variant_id": variant_id,
+            "lang": lang,
             "stage": stage,
             "source": context.source_asset,
             "options": context.options,
-            "base_prefix": f"jobs/{context.job_id}/{variant['lang']}",
+            "base_prefix": f"jobs/{context.job_id}/{lang}",
             "expect_tts": context.options.get("dub", True),
             "voice_profile": context.voice_profile,
         }
-        await rabbitmq.publish(f"stage.{stage}", payload)
+        if stage == "mix":
+            payload["burn_text_in_frame"] = fuses_text_in_frame(context.options)
+        return f"stage.{stage}", payload
 
-    async def get_next_stage(self, job_id: str, current_stage: str, lang: str) -> Optional[str]:
-        job = await database.fetch_job(job_id)
-        if job is None:
-            return None
-        options = job.get("options") or {}
-        if current_stage not in PIPELINE:
-            return None
-        idx = PIPELINE.index(current_stage)
-        for stage in PIPELINE[idx + 1 :]:
-            if self.should_skip(stage, options):
-                await publish_job_event(job_id, stage, "skipped", lang, progress=1.0)
-                continue
-            return stage
-        return None
+    async def job_stage_message(self, stage: str, context: JobContext) -> Optional[StageMessage]:
+        async with self._lock:
+            dispatched = self._job_stages.setdefault(context.job_id, set())
+            if stage in dispatched:
+                return None
+            dispatched.add(stage)
+        payload = {
+            "job_id": context.job_id,
+            "project_id": context.project_id,
+            "stage": stage,
+            "source": context.source_asset,
+            "options": context.options,
+            "langs": sorted(set(context.variants.values())),
+            "base_prefix": f"jobs/{context.job_id}",
+            "voice_profile": context.voice_profile,
+        }
+        return f"stage.{stage}", payload
 
     def should_skip(self, stage: str, options: Dict[str, Any]) -> bool:
         if stage == "subs" and not options.get("subs", True):
             return True
         if stage == "textinframe" and not options.get("replace_text_in_frame", False):
             return True
+        if stage in ("textinframe", "video") and fuses_text_in_frame(options):
+            return True
         if stage == "tts" and not options.get("dub", True):
             return True
         return False
@@ -171,12 +498,14 @@ class Orchestrator:
             return
         statuses = {variant["status"] for variant in job["variants"]}
         if statuses.issubset({"done"}):
+            self.contexts.evict(job_id)
+            self._job_stages.pop(job_id, None)
             await database.update_job_status(job_id, "done")
             await publish_job_event(job_id, "job", "done", None, progress=1.0)
             options = job.get("options") or {}
             if options.get("upload_to_youtube"):
-                for variant in job["variants"]:
-                    await rabbitmq.publish(
+                await rabbitmq.publish_batch(
+                    (
                         "youtube.upload",
                         {
                             "job_id": job_id,
@@ -186,13 +515,17 @@ class Orchestrator:
                             "subs_url": variant.get("subs_url"),
                         },
                     )
+                    for variant in job["variants"]
+                )
         elif any(status == "error" for status in statuses):
+            self.contexts.evict(job_id)
+            self._job_stages.pop(job_id, None)
             await database.update_job_status(job_id, "partial")
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     orchestrator = Orchestrator()
-    await orchestrator.start()
+    await orchestrator.start(ready)
 
 
 if __name__ == "__main__":
@@ -4,35 +4,31 @@ import asyncio
 import json
 import math
 import shutil
-import struct
-import subprocess
 import tempfile
 import wave
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
+import numpy as np
+from glocal_service_kit import (
+    cpu_executor,
+    database,
+    ffprobe,
+    job_stage_key,
+    publish_job_event,
+    rabbitmq,
+    storage,
+)
 
+IO_CONCURRENCY = 4
+BLOCK_FRAMES = 65536
+SILENCE_THRESHOLD = 500
 
-async def probe_media(path: Path) -> Dict[str, float]:
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration,bit_rate",
-        "-of",
-        "json",
-        str(path),
-    ]
-    result = await asyncio.to_thread(
-        subprocess.run,
-        cmd,
-        capture_output=True,
-        text=True,
-        check=True,
+
+async def probe_media(source: str) -> Dict[str, float]:
+    data = json.loads(
+        await ffprobe(["-show_entries", "format=duration,bit_rate", "-of", "json", source])
     )
-    data = json.loads(result.stdout)
     fmt = data.get("format", {})
     duration = float(fmt.get("duration", 0.0))
     bitrate = float(fmt.get("bit_rate", 0.0))
@@ -45,18 +41,16 @@ def analyze_audio(path: Path) -> Dict[str, float]:
     with wave.open(str(path), "rb") as wf:
         frame_count = wf.getnframes()
         sample_rate = wf.getframerate()
-        raw = wf.readframes(frame_count)
-        samples = struct.iter_unpack("<h", raw)
-        total = 0
-        silence = 0
-        threshold = 500
-        for sample in samples:
-            value = abs(sample[0])
-            total += value**2
-            if value < threshold:
-                silence += 1
         if frame_count == 0:
             return {"average_loudness": -30.0, "silence_seconds": 0.0}
+        total = 0
+        silence = 0
+        # Fixed-size blocks keep memory flat however long the track is.
+        while block := wf.readframes(BLOCK_FRAMES):
+            # Widen before squaring: int16 would overflow, and abs(-32768) does not fit either.
+            samples = np.frombuffer(block, dtype="<i2").astype(np.int64)
+            total += int(np.dot(samples, samples))
+            silence += int(np.count_nonzero(np.abs(samples) < SILENCE_THRESHOLD))
         rms = math.sqrt(total / frame_count) / 32767.0
         loudness = 20 * math.log10(rms + 1e-6)
         silence_seconds = silence / sample_rate
@@ -80,14 +74,12 @@ async def handle_message(message: Dict[str, Any]) -> None:
         video_key = job_stage_key(job_id, lang, "textinframe", "out.mp4")
         if not await storage.object_exists(video_key):
             video_key = job_stage_key(job_id, lang, "mix", "out.mp4")
-        video_path = temp_dir / "final.mp4"
-        await storage.download_file(video_key, video_path)
-        metrics = await probe_media(video_path)
+        metrics = await probe_media(await storage.media_input(video_key, temp_dir / "final.mp4"))
         audio_path = temp_dir / "audio.wav"
         audio_key = job_stage_key(job_id, lang, "tts", "track.wav")
         if variant.get("audio_url"):
             await storage.download_file(audio_key, audio_path)
-        audio_metrics = analyze_audio(audio_path)
+        audio_metrics = await cpu_executor.run(analyze_audio, audio_path)
         report = {
             "duration": round(metrics["duration"], 2),
             "bitrate_kbps": round(metrics["bitrate"] / 1000.0, 2) if metrics["bitrate"] else 0.0,
@@ -131,10 +123,12 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("qc-agent", "stage.qc")
-    await rabbitmq.consume("qc-agent", handle_message)
+    if ready is not None:
+        ready.set()
+    await rabbitmq.consume("qc-agent", handle_message, concurrency=IO_CONCURRENCY)
 
 
 if __name__ == "__main__":
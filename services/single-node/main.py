@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import List
+
+os.environ.setdefault("RUNTIME_MODE", "local")
+
+from glocal_service_kit import (  # noqa: E402
+    LocalBroker,
+    cpu_executor,
+    database,
+    parse_s3_url,
+    rabbitmq,
+)
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent
+SERVICES = [
+    "ingest-agent",
+    "orchestrator",
+    "asr-agent",
+    "translate-agent",
+    "tts-agent",
+    "mix-agent",
+    "subs-agent",
+    "textinframe-agent",
+    "qc-agent",
+    "yt-uploader",
+]
+POLL_INTERVAL = 2.0
+
+
+def load_service(name: str) -> ModuleType:
+    module_name = name.replace("-", "_")
+    path = SERVICES_DIR / name / "main.py"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"Cannot load service {name}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    # CPU pool workers are separate interpreters and must find the module by the same name.
+    cpu_executor.register_module(module_name, str(path))
+    return module
+
+
+async def wait_until_ready(name: str, task: asyncio.Task[None], ready: asyncio.Event) -> None:
+    waiter = asyncio.ensure_future(ready.wait())
+    await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    if ready.is_set():
+        return
+    waiter.cancel()
+    # The service stopped before declaring its queues; surface why instead of waiting forever.
+    task.result()
+    raise RuntimeError(f"Service {name} exited before declaring its queues")
+
+
+async def start_services(names: List[str]) -> List[asyncio.Task[None]]:
+    # Connect once up front so the services share a single pool instead of racing to create one.
+    await database.connect()
+    tasks: List[asyncio.Task[None]] = []
+    readiness: List[asyncio.Event] = []
+    for name in names:
+        ready = asyncio.Event()
+        tasks.append(asyncio.create_task(load_service(name).main(ready)))
+        readiness.append(ready)
+    # Each service sets its event once its queues are declared; nothing may be published
+    # before that, or the local broker would drop it.
+    await asyncio.gather(
+        *(wait_until_ready(*entry) for entry in zip(names, tasks, readiness, strict=True))
+    )
+    return tasks
+
+
+async def submit_job(job_id: str) -> None:
+    await rabbitmq.publish("job.created", {"job_id": job_id})
+
+
+async def submit_asset(asset: dict) -> None:
+    _, key = parse_s3_url(asset["s3_url"])
+    await rabbitmq.publish(
+        "asset.uploaded",
+        {
+            "asset_id": asset["id"],
+            "project_id": asset["project_id"],
+            "key": key,
+            "type": asset["type"],
+        },
+    )
+
+
+async def poll_queued_jobs(interval: float) -> None:
+    submitted: set[str] = set()
+    ingesting: set[str] = set()
+    while True:
+        # Assets are picked up here too; ingest marks them with a probe (or ingest_error).
+        assets = await database.fetch_uningested_assets()
+        job_ids = await database.fetch_queued_job_ids()
+        # Ids drop out once ingest or the orchestrator has moved them on, so both sets stay
+        # bounded by what is still waiting.
+        ingesting.intersection_update(asset["id"] for asset in assets)
+        submitted.intersection_update(job_ids)
+        for asset in assets:
+            if asset["id"] not in ingesting:
+                ingesting.add(asset["id"])
+                await submit_asset(asset)
+        for job_id in job_ids:
+            if job_id not in submitted:
+                submitted.add(job_id)
+                await submit_job(job_id)
+        await asyncio.sleep(interval)
+
+
+async def run(args: argparse.Namespace) -> None:
+    tasks = await start_services(SERVICES)
+    try:
+        for job_id in args.job:
+            await submit_job(job_id)
+        if args.job and not args.poll and isinstance(rabbitmq, LocalBroker):
+            await rabbitmq.join()
+            return
+        if args.poll:
+            tasks.append(asyncio.create_task(poll_queued_jobs(args.poll_interval)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await database.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the whole pipeline in one process")
+    parser.add_argument("--job", action="append", default=[], help="job id to process, repeatable")
+    parser.add_argument("--poll", action="store_true", help="pick up queued jobs from Postgres")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
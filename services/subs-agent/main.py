@@ -5,10 +5,12 @@ import math
 import shutil
 import tempfile
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
 
+IO_CONCURRENCY = 4
+
 
 def format_ts(seconds: float, sep: str = ",") -> str:
     hours, remainder = divmod(seconds, 3600)
@@ -97,10 +99,12 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("subs-agent", "stage.subs")
-    await rabbitmq.consume("subs-agent", handle_message)
+    if ready is not None:
+        ready.set()
+    await rabbitmq.consume("subs-agent", handle_message, concurrency=IO_CONCURRENCY)
 
 
 if __name__ == "__main__":
@@ -2,18 +2,24 @@ from __future__ import annotations
 
 import asyncio
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
-
-FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-
-
-async def run_ffmpeg(cmd: list[str]) -> None:
-    await asyncio.to_thread(subprocess.run, cmd, check=True)
+from glocal_service_kit import (
+    HLS_CONTENT_TYPES,
+    HLS_MANIFEST,
+    database,
+    ffmpeg_input,
+    job_stage_key,
+    keyframe_args,
+    localized_text,
+    publish_job_event,
+    rabbitmq,
+    storage,
+    text_overlay_filter,
+    write_mp4_and_hls,
+)
 
 
 async def handle_message(message: Dict[str, Any]) -> None:
@@ -25,60 +31,47 @@ async def handle_message(message: Dict[str, Any]) -> None:
     temp_dir = Path(tempfile.mkdtemp(prefix="textinframe-"))
     try:
         mix_key = job_stage_key(job_id, lang, "mix", "out.mp4")
-        mix_path = temp_dir / "mix.mp4"
-        await storage.download_file(mix_key, mix_path)
+        mix_input = await storage.media_input(mix_key, temp_dir / "mix.mp4")
         overlay_path = temp_dir / "overlay.mp4"
-        text_value = f"[Localized TEXT {lang}]"
-        drawtext = (
-            f"drawtext=fontfile={FONT_PATH}:text='{text_value}':"
-            "fontcolor=white:fontsize=48:x=40:y=40:box=1:boxcolor=black@0.45"
-        )
-        await run_ffmpeg(
-            [
-                "ffmpeg",
-                "-y",
-                "-i",
-                str(mix_path),
-                "-vf",
-                drawtext,
-                "-c:a",
-                "copy",
-                str(overlay_path),
-            ]
-        )
         hls_dir = temp_dir / "hls"
         hls_dir.mkdir(exist_ok=True)
-        await run_ffmpeg(
+
+        async def report_progress(fraction: float) -> None:
+            await publish_job_event(
+                job_id, "textinframe", "processing", lang, progress=0.15 + 0.65 * fraction
+            )
+
+        encode = await write_mp4_and_hls(
             [
                 "ffmpeg",
                 "-y",
-                "-i",
-                str(overlay_path),
-                "-codec:v",
+                *ffmpeg_input(mix_input),
+                "-map",
+                "0:v",
+                "-map",
+                "0:a?",
+                "-vf",
+                text_overlay_filter(localized_text(lang)),
+                "-c:v",
                 "libx264",
-                "-codec:a",
-                "aac",
-                "-start_number",
-                "0",
-                "-hls_time",
-                "2",
-                "-hls_list_size",
-                "0",
-                "-hls_segment_filename",
-                str(hls_dir / "segment_%03d.ts"),
-                str(hls_dir / "index.m3u8"),
-            ]
+                *keyframe_args(),
+                "-c:a",
+                "copy",
+            ],
+            overlay_path,
+            hls_dir,
+            duration=(message["source"].get("probe") or {}).get("duration"),
+            on_progress=report_progress,
         )
         video_key = job_stage_key(job_id, lang, "textinframe", "out.mp4")
-        preview_key = job_stage_key(job_id, lang, "textinframe", "hls", "index.m3u8")
+        preview_key = job_stage_key(job_id, lang, "textinframe", "hls", HLS_MANIFEST)
         await storage.upload_file(overlay_path, video_key, "video/mp4")
-        for segment in hls_dir.glob("*"):
-            content_type = "application/x-mpegURL" if segment.suffix == ".m3u8" else "video/mp2t"
-            await storage.upload_file(
-                segment,
-                job_stage_key(job_id, lang, "textinframe", "hls", segment.name),
-                content_type,
-            )
+        hls_upload = await storage.upload_directory(
+            hls_dir,
+            job_stage_key(job_id, lang, "textinframe", "hls"),
+            HLS_CONTENT_TYPES,
+            manifest=HLS_MANIFEST,
+        )
         await database.update_variant(
             variant_id,
             video_url=f"s3://{storage.bucket}/{video_key}",
@@ -96,6 +89,12 @@ async def handle_message(message: Dict[str, Any]) -> None:
                 "video_key": video_key,
                 "preview_key": preview_key,
                 "beta": True,
+                "hls_upload": hls_upload.as_dict(),
+                "ffmpeg": encode.as_dict(),
+                "timings": {
+                    "encode_s": encode.seconds,
+                    "hls_upload_s": round(hls_upload.seconds, 3),
+                },
             },
         )
     except Exception as exc:  # pragma: no cover
@@ -115,9 +114,11 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("textinframe-agent", "stage.textinframe")
+    if ready is not None:
+        ready.set()
     await rabbitmq.consume("textinframe-agent", handle_message)
 
 
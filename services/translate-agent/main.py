@@ -1,70 +1,284 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
+import re
 import shutil
 import tempfile
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Protocol, Tuple
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
+from glocal_service_kit import (
+    database,
+    get_settings,
+    job_key,
+    job_stage_key,
+    publish_job_event,
+    rabbitmq,
+    storage,
+)
 
+IO_CONCURRENCY = 4
+MEMORY_CACHE_SIZE = 20000
+GLOSSARY_CACHE_SIZE = 256
+# Glossary terms travel through the backend as opaque tokens like "⟦0⟧".
+PLACEHOLDER = "\u27e6{}\u27e7"
+PLACEHOLDER_PATTERN = re.compile("\u27e6(\\d+)\u27e7")
 
-def transform_text(text: str, lang: str, index: int) -> str:
-    styled = text.upper() if index % 2 == 0 else text.lower()
-    return f"{styled} [{lang}]"
+
+def transform_text(text: str, lang: str) -> str:
+    return f"{text} [{lang}]"
+
+
+class TranslationBackend(Protocol):
+    name: str
+    # Bump when the backend's output changes (new model, prompt, ...): it is part of the
+    # translation memory key, so stale outputs are never served for the new backend.
+    version: str
+
+    async def translate_batch(self, texts: List[str], lang: str) -> List[str]:
+        ...
+
+
+class StubBackend:
+    name = "stub"
+    version = "1"
+
+    async def translate_batch(self, texts: List[str], lang: str) -> List[str]:
+        return [transform_text(text, lang) for text in texts]
+
+
+BACKENDS: Dict[str, TranslationBackend] = {"stub": StubBackend()}
+
+
+def get_backend(name: str) -> TranslationBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError as exc:
+        raise ValueError(f"Translation backend {name!r} is not available") from exc
+
+
+def normalize_source(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256(normalize_source(text).encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class Glossary:
+    version: str
+    # targets[i] belongs to capture group i + 1 of pattern.
+    targets: List[Dict[str, str]]
+    pattern: Optional[re.Pattern[str]]
+
+    def protect(self, text: str, lang: str) -> Tuple[str, List[str]]:
+        # Terms are matched in the source and swapped for placeholders before the backend
+        # sees the text, so real backends can neither translate nor reword them.
+        if self.pattern is None:
+            return text, []
+        terms: List[str] = []
+
+        def hold(match: re.Match[str]) -> str:
+            # The matched group says which term hit, so no lookup has to agree with the
+            # regex's own case folding. Terms without a target for this language stay verbatim.
+            terms.append(self.targets[(match.lastindex or 1) - 1].get(lang, match.group(0)))
+            return PLACEHOLDER.format(len(terms) - 1)
+
+        return self.pattern.sub(hold, text), terms
+
+
+def restore_terms(text: str, terms: List[str]) -> str:
+    if not terms:
+        return text
+
+    def put_back(match: re.Match[str]) -> str:
+        index = int(match.group(1))
+        return terms[index] if index < len(terms) else match.group(0)
+
+    return PLACEHOLDER_PATTERN.sub(put_back, text)
+
+
+def glossary_terms(entries: List[Dict[str, Any]]) -> Dict[str, Dict[str, str]]:
+    # Terms match case-insensitively, so rows differing only in case collapse to the last one.
+    return {entry["term"].lower(): entry["target_map"] or {} for entry in entries}
+
+
+def glossary_version(entries: List[Dict[str, Any]]) -> str:
+    canonical = sorted(glossary_terms(entries).items())
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def build_glossary(entries: List[Dict[str, Any]], version: str) -> Glossary:
+    by_term = glossary_terms(entries)
+    if not by_term:
+        return Glossary(version, [], None)
+    # One alternation for every term, longest first so "Glocal Ads" wins over "Glocal".
+    terms = sorted(by_term, key=len, reverse=True)
+    alternatives = "|".join(f"({re.escape(term)})" for term in terms)
+    pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+    return Glossary(version, [by_term[term] for term in terms], pattern)
+
+
+class LRUCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[Any, Any] = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+glossaries = LRUCache(GLOSSARY_CACHE_SIZE)
+memory = LRUCache(MEMORY_CACHE_SIZE)
+settings = get_settings()
+backend = get_backend(settings.translation_backend)
+backend_id = f"{backend.name}:{backend.version}"
+# Shared by every language and message in the process, so the backend sees a bounded load.
+backend_slots = asyncio.Semaphore(max(settings.translation_concurrency, 1))
+
+
+async def backend_translate(texts: List[str], lang: str) -> List[str]:
+    size = max(settings.translation_batch_size, 1)
+
+    async def run(batch: List[str]) -> List[str]:
+        async with backend_slots:
+            return await backend.translate_batch(batch, lang)
+
+    results = await asyncio.gather(
+        *(run(texts[start : start + size]) for start in range(0, len(texts), size))
+    )
+    return [text for batch in results for text in batch]
+
+
+async def load_glossary(project_id: str) -> Glossary:
+    # Rows are re-read per job so edits apply at once; the matcher is only compiled again
+    # when they actually changed.
+    entries = await database.fetch_glossary(project_id)
+    version = glossary_version(entries)
+    glossary: Optional[Glossary] = glossaries.get((project_id, version))
+    if glossary is None:
+        glossary = build_glossary(entries, version)
+        glossaries.put((project_id, version), glossary)
+    return glossary
+
+
+async def translate_segments(
+    texts: List[str],
+    lang: str,
+    glossary: Glossary,
+) -> Tuple[List[str], Dict[str, int]]:
+    hashes = [source_hash(text) for text in texts]
+    found: Dict[str, str] = {}
+    for digest in set(hashes):
+        cached = memory.get((digest, lang, glossary.version, backend_id))
+        if cached is not None:
+            found[digest] = cached
+    memory_hits = len(found)
+    missing = sorted(set(hashes) - found.keys())
+    stored: Dict[str, str] = {}
+    if missing:
+        stored = await database.fetch_translations(lang, glossary.version, backend_id, missing)
+        found.update(stored)
+    pending = {
+        digest: text for digest, text in zip(hashes, texts, strict=True) if digest not in found
+    }
+    protected = [glossary.protect(text, lang) for text in pending.values()]
+    outputs = await backend_translate([text for text, _ in protected], lang)
+    fresh: Dict[str, Tuple[str, str]] = {
+        digest: (text, restore_terms(output, terms))
+        for (digest, text), output, (_, terms) in zip(
+            pending.items(), outputs, protected, strict=True
+        )
+    }
+    if fresh:
+        await database.store_translations(
+            lang,
+            glossary.version,
+            backend_id,
+            [(digest, text, translated) for digest, (text, translated) in fresh.items()],
+        )
+        found.update({digest: translated for digest, (_, translated) in fresh.items()})
+    for digest in stored.keys() | fresh.keys():
+        memory.put((digest, lang, glossary.version, backend_id), found[digest])
+    stats = {"memory_hits": memory_hits, "db_hits": len(stored), "translated": len(fresh)}
+    return [found[digest] for digest in hashes], stats
+
+
+async def translate_language(
+    job_id: str,
+    lang: str,
+    data: List[Dict[str, Any]],
+    glossary: Glossary,
+) -> Dict[str, int]:
+    texts, memory_stats = await translate_segments(
+        [segment["text"] for segment in data], lang, glossary
+    )
+    translated = [
+        {**segment, "text": text, "lang": lang} for segment, text in zip(data, texts, strict=True)
+    ]
+    await storage.upload_bytes(
+        json.dumps(translated, indent=2).encode("utf-8"),
+        job_stage_key(job_id, lang, "translate", "segments.json"),
+        "application/json",
+    )
+    await publish_job_event(job_id, "translate", "processing", lang, progress=0.85)
+    return memory_stats
 
 
 async def handle_message(message: Dict[str, Any]) -> None:
     job_id = message["job_id"]
-    variant_id = message["variant_id"]
-    lang = message["lang"]
+    # One message covers every language of the job; per-variant messages still work.
+    langs: List[str] = message.get("langs") or [message["lang"]]
     base_prefix = message["base_prefix"]
     await database.connect()
-    await publish_job_event(job_id, "translate", "processing", lang, progress=0.2)
+    for lang in langs:
+        await publish_job_event(job_id, "translate", "processing", lang, progress=0.2)
     temp_dir = Path(tempfile.mkdtemp(prefix="translate-"))
     try:
         segments_path = temp_dir / "segments.json"
         await storage.download_file(
-            job_stage_key(job_id, lang, "asr", "segments.json"),
+            job_key(job_id, "asr", "segments.json"),
             segments_path,
         )
         data: List[Dict[str, Any]] = json.loads(segments_path.read_text())
-        translated: List[Dict[str, Any]] = []
-        for idx, segment in enumerate(data):
-            translated.append(
-                {
-                    **segment,
-                    "text": transform_text(segment["text"], lang, idx),
-                    "lang": lang,
-                }
-            )
-        translated_json = json.dumps(translated, indent=2)
-        await storage.upload_bytes(
-            translated_json.encode("utf-8"),
-            job_stage_key(job_id, lang, "translate", "segments.json"),
-            "application/json",
+        glossary = await load_glossary(message["project_id"])
+        memory_stats = await asyncio.gather(
+            *(translate_language(job_id, lang, data, glossary) for lang in langs)
         )
-        await publish_job_event(job_id, "translate", "processing", lang, progress=0.85)
         await rabbitmq.publish(
             "stage.translate.completed",
             {
                 "job_id": job_id,
-                "variant_id": variant_id,
-                "lang": lang,
                 "stage": "translate",
                 "status": "completed",
                 "base_prefix": base_prefix,
+                "langs": langs,
+                "backend": backend_id,
+                "translation_memory": dict(zip(langs, memory_stats, strict=True)),
             },
         )
     except Exception as exc:  # pragma: no cover
-        await publish_job_event(job_id, "translate", "error", lang, message=str(exc))
+        for lang in langs:
+            await publish_job_event(job_id, "translate", "error", lang, message=str(exc))
         await rabbitmq.publish(
             "stage.translate.failed",
             {
                 "job_id": job_id,
-                "variant_id": variant_id,
-                "lang": lang,
                 "stage": "translate",
                 "status": "error",
                 "error": str(exc),
@@ -74,10 +288,12 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("translate-agent", "stage.translate")
-    await rabbitmq.consume("translate-agent", handle_message)
+    if ready is not None:
+        ready.set()
+    await rabbitmq.consume("translate-agent", handle_message, concurrency=IO_CONCURRENCY)
 
 
 if __name__ == "__main__":
@@ -1,27 +1,45 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
-import math
 import shutil
-import struct
 import tempfile
 import wave
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from glocal_service_kit import database, job_stage_key, publish_job_event, rabbitmq, storage
+import numpy as np
+from glocal_service_kit import (
+    content_key,
+    cpu_executor,
+    database,
+    job_stage_key,
+    publish_job_event,
+    rabbitmq,
+    storage,
+)
 
 SAMPLE_RATE = 44100
+CHUNK_FRAMES = SAMPLE_RATE
+# Part of every clip key: bump it whenever the renderer's output changes.
+SYNTH_ENGINE = "sine-v1"
+CLIP_CACHE_BYTES = 64 * 1024 * 1024
+CLIP_IO_CONCURRENCY = 8
+
+
+def sine_chunks(frequency: float, frame_count: int) -> Iterator[bytes]:
+    step = 2 * np.pi * frequency
+    for offset in range(0, frame_count, CHUNK_FRAMES):
+        n = np.arange(offset, min(offset + CHUNK_FRAMES, frame_count), dtype=np.float64)
+        # astype truncates toward zero, matching int() on the scalar path this replaced.
+        yield (32767 * np.sin(step * n / SAMPLE_RATE)).astype("<i2").tobytes()
 
 
 def sine_wave(frequency: float, duration: float) -> bytes:
-    frame_count = int(duration * SAMPLE_RATE)
-    buffer = bytearray()
-    for n in range(frame_count):
-        value = int(32767 * math.sin(2 * math.pi * frequency * n / SAMPLE_RATE))
-        buffer.extend(struct.pack("<h", value))
-    return bytes(buffer)
+    return b"".join(sine_chunks(frequency, int(duration * SAMPLE_RATE)))
 
 
 def pad_silence(duration: float) -> bytes:
@@ -29,18 +47,140 @@ def pad_silence(duration: float) -> bytes:
     return b"\x00\x00" * frame_count
 
 
-async def synthesize(segments: List[Dict[str, Any]], target: Path) -> None:
+@dataclass(frozen=True)
+class ClipSpec:
+    text: str
+    frequency: float
+    frame_count: int
+
+
+def clip_specs(segments: List[Dict[str, Any]]) -> List[ClipSpec]:
+    specs: List[ClipSpec] = []
+    for index, segment in enumerate(segments):
+        seg_duration = max(float(segment["end"]) - float(segment["start"]), 0.4)
+        specs.append(ClipSpec(segment["text"], 220.0 + index * 40, int(seg_duration * SAMPLE_RATE)))
+    return specs
+
+
+def voice_identity(voice_profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not voice_profile:
+        return {}
+    params = voice_profile.get("provider_params") or {}
+    if isinstance(params, str):
+        params = json.loads(params)
+    # Only what changes the rendered audio; renaming a profile keeps its clips.
+    return {"provider": voice_profile.get("provider"), "params": params}
+
+
+def clip_digest(spec: ClipSpec, voice: Dict[str, Any], lang: str) -> str:
+    identity = {
+        "engine": SYNTH_ENGINE,
+        "text": spec.text,
+        "voice": voice,
+        "lang": lang,
+        "sample_rate": SAMPLE_RATE,
+        "frequency": spec.frequency,
+        "frames": spec.frame_count,
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def render_clip(spec: ClipSpec) -> bytes:
+    return b"".join(sine_chunks(spec.frequency, spec.frame_count))
+
+
+def render_clips(specs: Dict[str, ClipSpec]) -> List[Tuple[str, bytes]]:
+    return [(digest, render_clip(spec)) for digest, spec in specs.items()]
+
+
+def write_track(clips: List[bytes], target: Path) -> None:
     with wave.open(str(target), "w") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(2)
         wf.setframerate(SAMPLE_RATE)
-        for index, segment in enumerate(segments):
-            seg_duration = max(float(segment["end"]) - float(segment["start"]), 0.4)
-            freq = 220.0 + index * 40
-            wf.writeframes(sine_wave(freq, seg_duration))
+        for clip in clips:
+            wf.writeframes(clip)
             wf.writeframes(pad_silence(0.1))
 
 
+class ClipCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, digest: str) -> Optional[bytes]:
+        clip = self._entries.get(digest)
+        if clip is not None:
+            self._entries.move_to_end(digest)
+        return clip
+
+    def put(self, digest: str, clip: bytes) -> None:
+        if len(clip) > self.max_bytes or digest in self._entries:
+            return
+        self._entries[digest] = clip
+        self.size += len(clip)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+clip_cache = ClipCache(CLIP_CACHE_BYTES)
+
+
+async def load_clip(digest: str) -> Optional[bytes]:
+    return await storage.get_bytes(content_key("tts-clips", digest, ".pcm"))
+
+
+async def store_clip(digest: str, clip: bytes) -> None:
+    await storage.upload_bytes(clip, content_key("tts-clips", digest, ".pcm"), "audio/L16")
+
+
+async def synthesize(
+    segments: List[Dict[str, Any]],
+    voice_profile: Optional[Dict[str, Any]],
+    lang: str,
+    target: Path,
+) -> Dict[str, int]:
+    specs = clip_specs(segments)
+    voice = voice_identity(voice_profile)
+    digests = [clip_digest(spec, voice, lang) for spec in specs]
+    clips: Dict[str, bytes] = {}
+    for digest in digests:
+        cached = clip_cache.get(digest)
+        if cached is not None:
+            clips[digest] = cached
+    memory_hits = len(clips)
+    slots = asyncio.Semaphore(CLIP_IO_CONCURRENCY)
+
+    async def bounded(coro: Any) -> Any:
+        async with slots:
+            return await coro
+
+    missing = [digest for digest in dict.fromkeys(digests) if digest not in clips]
+    loaded = await asyncio.gather(*(bounded(load_clip(digest)) for digest in missing))
+    stored = {
+        digest: clip for digest, clip in zip(missing, loaded, strict=True) if clip is not None
+    }
+    clips.update(stored)
+    to_render: Dict[str, ClipSpec] = {
+        digest: spec for digest, spec in zip(digests, specs, strict=True) if digest not in clips
+    }
+    # Only the misses are rendered, in the CPU pool so the event loop keeps serving heartbeats.
+    rendered = await cpu_executor.run(render_clips, to_render) if to_render else []
+    clips.update(rendered)
+    await asyncio.gather(*(bounded(store_clip(digest, clip)) for digest, clip in rendered))
+    for digest in stored.keys() | to_render.keys():
+        clip_cache.put(digest, clips[digest])
+    await asyncio.to_thread(write_track, [clips[digest] for digest in digests], target)
+    return {
+        "clips": len(digests),
+        "memory_hits": memory_hits,
+        "storage_hits": len(stored),
+        "rendered": len(rendered),
+    }
+
+
 async def handle_message(message: Dict[str, Any]) -> None:
     job_id = message["job_id"]
     variant_id = message["variant_id"]
@@ -57,7 +197,7 @@ async def handle_message(message: Dict[str, Any]) -> None:
         )
         segments: List[Dict[str, Any]] = json.loads(segments_path.read_text())
         audio_path = temp_dir / "track.wav"
-        await synthesize(segments, audio_path)
+        clip_stats = await synthesize(segments, message.get("voice_profile"), lang, audio_path)
         key = job_stage_key(job_id, lang, "tts", "track.wav")
         await storage.upload_file(audio_path, key, "audio/wav")
         await database.update_variant(
@@ -75,6 +215,7 @@ async def handle_message(message: Dict[str, Any]) -> None:
                 "status": "completed",
                 "base_prefix": base_prefix,
                 "audio_key": key,
+                "tts_cache": clip_stats,
             },
         )
     except Exception as exc:  # pragma: no cover
@@ -94,9 +235,11 @@ async def handle_message(message: Dict[str, Any]) -> None:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await database.connect()
     await rabbitmq.declare_queue("tts-agent", "stage.tts")
+    if ready is not None:
+        ready.set()
     await rabbitmq.consume("tts-agent", handle_message)
 
 
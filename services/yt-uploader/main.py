@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from glocal_service_kit import publish_job_event, rabbitmq
 
@@ -16,8 +16,10 @@ async def handle_message(message: Dict[str, Any]) -> None:
         await publish_job_event(job_id, "youtube", "done", lang, message=url)
 
 
-async def main() -> None:
+async def main(ready: Optional[asyncio.Event] = None) -> None:
     await rabbitmq.declare_queue("yt-uploader", "youtube.upload")
+    if ready is not None:
+        ready.set()
     await rabbitmq.consume("yt-uploader", handle_message)
 
 